@@ -1,4 +1,6 @@
 import argparse
+from dataclasses import replace
+import time
 from typing import Union
 import gymnasium as gym
 from matplotlib import pyplot as plt
@@ -16,7 +18,10 @@ from stable_baselines3.common.vec_env import VecEnv
 from stockcore.parameters import BenchParameters, DataParameters, ModelParameters
 from stocksense.api import data as scdata
 import stockcore.environment as scenv
-from stockcore.models import build_model
+from stockcore.backtest import backtest
+from stockcore.dataset import load_dataset
+from stockcore.models import build_model, predict_batched
+from stockcore.policy import export_policy
 
 
 OUTPUT_DIR = "./output"
@@ -27,23 +32,14 @@ def build_folders(root: str) -> Path:
     return Path(OUTPUT_DIR, root)
 
 
-async def _load_data(data_params: DataParameters) -> pd.DataFrame:
-    tasks = []
-    for symbol in data_params.symbols:
-        tasks.append(scdata.get_kline_df(
-            data_params.endpoint,
-            symbol=symbol,
-            timeframe=data_params.timeframe,
-            since=data_params.since,
-            until=data_params.until
-        ))
-    results = await asyncio.gather(*tasks)
-    return results
-
-
 def load_data(data_params: DataParameters) -> dict[str, pd.DataFrame]:
-    results = asyncio.run(_load_data(data_params))
-    return dict(zip(data_params.symbols, results))
+    endpoint = scdata.get_endpoint(data_params.endpoint)
+    return asyncio.run(endpoint.get_multiple_kline(
+        data_params.symbols,
+        data_params.since,
+        data_params.until,
+        data_params.timeframe
+    ))
 
 
 def plot_data(df_dict: dict[str, pd.DataFrame], train_split_end_date, val_split_end_date, save_path: Path):
@@ -75,12 +71,13 @@ def plot_data(df_dict: dict[str, pd.DataFrame], train_split_end_date, val_split_
 
 
 def create_env(
-    dfs: list[pd.DataFrame],
+    data: list[pd.DataFrame] | scenv.MarketData | str,
     params: BenchParameters,
     verbose: int = 0
 ) -> scenv.MultiStockTradingEnv:
+    """Create an environment over K-line frames, or over market data (possibly published by name)"""
     env = scenv.MultiStockTradingEnv(
-        dfs=dfs,
+        **({"dfs": data} if isinstance(data, list) else {"market_data": data}),
         portfolio_initial_value=params.environment.initial_amount,
         trading_fees=params.environment.trading_fee,
         windows=params.environment.windows,
@@ -118,7 +115,8 @@ class ValidationCallback(BaseCallback):
         """
         if self.verbose <= 0:
             return True
-        if self.num_timesteps % self.eval_freq == 0:
+        # num_timesteps grows by the number of envs per call, evaluate whenever it crosses a multiple of eval_freq
+        if self.num_timesteps // self.eval_freq > (self.num_timesteps - self.training_env.num_envs) // self.eval_freq:
             return_values, mean_reward = self.evaluate_model()
             print(f"At Step {self.num_timesteps}, "
                   f"average portfolio return over {self.n_eval_episodes} episode(s): {np.mean(return_values):5.2f}%")
@@ -145,58 +143,59 @@ class ValidationCallback(BaseCallback):
         return return_values, mean_reward
 
 
-def main(benchmark_path: Path, model_path: Path):
-    # Create the output folder
-
-    root = build_folders(Path(benchmark_path).stem +
-                         "-" + Path(model_path).stem)
-
-    # Load the configuration file
-
-    bench_params = BenchParameters.from_json(benchmark_path)
-
-    # Load the data
-
-    print("Loading data...")
-    df_dict = load_data(bench_params.data)
-    dfs = list(df_dict.values())
-
-    # make sure all the dataframes have the same length
-    assert all(df.index.equals(dfs[0].index)
-               for df in dfs), "Dataframes have different datetime indices"
-
-    # Split the data
-
-    train_split_end = int(bench_params.data.train_ratio * len(dfs[0]))
-    train_split_end_date = dfs[0].index[train_split_end]
-    val_split_end = int(
-        (bench_params.data.train_ratio + bench_params.data.val_ratio) * len(dfs[0]))
-    val_split_end_date = dfs[0].index[val_split_end]
-
-    train_split = {symbol: df[:train_split_end_date]
-                   for symbol, df in df_dict.items()}
-    val_split = {symbol: df[train_split_end_date:val_split_end_date]
-                 for symbol, df in df_dict.items()}
-    test_split = {symbol: df[val_split_end_date:]
-                  for symbol, df in df_dict.items()}
-
-    # Plot the data
-
-    print("Plotting data...")
-    plot_data(df_dict, train_split_end_date,
-              val_split_end_date, root / "prices.png")
+def train_and_evaluate(
+    bench_params: BenchParameters,
+    model_params: ModelParameters,
+    splits: dict[str, list[pd.DataFrame] | scenv.MarketData | str],
+    root: Path,
+    batched_eval: bool = False,
+    seed: int = None
+) -> dict[str, float]:
+    """Train (or load) a model on the train set and evaluate it on the test set.
+
+    Parameters
+    ----------
+    bench_params : BenchParameters
+        The benchmark configuration
+    model_params : ModelParameters
+        The model configuration
+    splits : dict[str, list[pd.DataFrame] | MarketData | str]
+        Data of the "train", "val" and "test" sets, anything `create_env` accepts
+    root : Path
+        Output folder of the model and results
+    batched_eval : bool, optional
+        Whether to evaluate with batched inference and a vectorized backtest, by default False
+    seed : int, optional
+        Seed of the model, by default the one of `model_params` if any
+
+    Returns
+    -------
+    dict[str, float]
+        Summary of the test results
+    """
+    if seed is not None:
+        model_params = replace(model_params, params={**model_params.params, "seed": seed})
 
     # Create the environment
 
     print("Creating environment...")
     train_env = create_env(
-        list(train_split.values()),
+        splits["train"],
         bench_params,
         verbose=bench_params.environment.verbose
     )
+    n_envs = bench_params.environment.n_envs
+    if n_envs > 1:
+        # episodes of a fixed length start at random offsets, so the envs do not replay the same steps
+        first_idx = 0 if bench_params.environment.windows is None else bench_params.environment.windows - 1
+        train_env = scenv.VecMultiStockTradingEnv(
+            train_env, n_envs,
+            max_episode_duration=(bench_params.environment.episode_duration
+                                  or (train_env.get_dfs_length() - first_idx) // n_envs),
+            seed=(model_params.params or {}).get("seed"))
 
     val_env = create_env(
-        list(val_split.values()),
+        splits["val"],
         bench_params,
         verbose=0
     )
@@ -210,12 +209,11 @@ def main(benchmark_path: Path, model_path: Path):
     # Build the model
 
     print("Building model...")
-    model_params = ModelParameters.from_json(model_path)
-
     model = build_model(model_params, train_env)
 
     # Train or load the model
 
+    start = time.perf_counter()
     if model_params.force_retrain or not (root / "model.zip").exists():
         print("Training model...")
         model.learn(
@@ -228,39 +226,64 @@ def main(benchmark_path: Path, model_path: Path):
     else:
         print("Loading model...")
         model = model.load(root / "model")
+    train_seconds = time.perf_counter() - start
 
     train_env.close()
 
+    # Export the policy, for serving without stable-baselines3
+
+    export_policy(model, root / "policy", val_env.get_feature_columns())
+    print(f"Policy exported at {root / 'policy'}")
+
     # Evaluate the model
 
     print("Evaluating model...")
     test_env = create_env(
-        list(test_split.values()),
+        splits["test"],
         bench_params,
         verbose=0
     )
 
-    model.set_env(test_env)
-
-    done, truncated = False, False
-    observation, _ = test_env.reset()
-    pbar = tqdm(total=test_env.get_dfs_length())
-    while not done and not truncated:
-        position_index = model.predict(observation)[0]
-        pbar.update(1)
-        observation, reward, done, truncated, info = test_env.step(
-            position_index)
-    pbar.close()
+    # a model trained on n_envs envs cannot take a single env, and predicting does not need one
+    if model.n_envs == 1:
+        model.set_env(test_env)
+
+    start = time.perf_counter()
+    if batched_eval:
+        # observations do not depend on the portfolio, so predict them all, then replay the actions
+        observations = test_env.get_observations()
+        actions = predict_batched(model, observations[:-1])
+        result = backtest(
+            test_env.get_prices(),
+            actions,
+            trading_fees=test_env.trading_fees,
+            portfolio_initial_value=test_env.portfolio_initial_value,
+            start=test_env.get_dfs_length() - len(observations)
+        )
+        history, reward_history = result.value, result.rewards
+    else:
+        done, truncated = False, False
+        observation, _ = test_env.reset()
+        pbar = tqdm(total=test_env.get_dfs_length())
+        while not done and not truncated:
+            position_index = model.predict(observation)[0]
+            pbar.update(1)
+            observation, reward, done, truncated, info = test_env.step(
+                position_index)
+        pbar.close()
+        history, reward_history = test_env.get_history(), test_env.get_history_reward()
+
+    eval_seconds = time.perf_counter() - start
 
     # Log the results
 
     print("Logging results...")
-    test_env.log()
+    print(f"Portfolio Return : {100 * (history[-1] / history[0] - 1):5.2f}%")
 
     date = test_env.get_date()[bench_params.environment.windows-1:]
     date = pd.to_datetime(date, unit="ms")
-    hist = pd.Series(test_env.get_history())
-    reward_hist = pd.Series(test_env.get_history_reward())
+    hist = pd.Series(history)
+    reward_hist = pd.Series(reward_history)
     reward_hist_mean = reward_hist.rolling(20).mean()
     reward_hist_std = reward_hist.rolling(20).std()
 
@@ -304,6 +327,41 @@ def main(benchmark_path: Path, model_path: Path):
 
     print(f"History saved at {root / 'results.csv'}")
 
+    return {
+        "portfolio_return": 100 * (history[-1] / history[0] - 1),
+        "final_value": float(history[-1]),
+        "mean_reward": float(np.mean(reward_history)),
+        "std_reward": float(np.std(reward_history)),
+        "test_steps": len(reward_history),
+        "train_seconds": train_seconds,
+        "eval_seconds": eval_seconds,
+    }
+
+
+def main(benchmark_path: Path, model_path: Path, batched_eval: bool = False, refresh_data: bool = False):
+    # Create the output folder
+
+    root = build_folders(Path(benchmark_path).stem +
+                         "-" + Path(model_path).stem)
+
+    # Load the configuration file
+
+    bench_params = BenchParameters.from_json(benchmark_path)
+    model_params = ModelParameters.from_json(model_path)
+
+    # Load the data, split and preprocessed, from the dataset cache if possible
+
+    print("Loading data...")
+    dataset = load_dataset(bench_params.data, load_data, refresh=refresh_data)
+
+    # Plot the data
+
+    print("Plotting data...")
+    plot_data(dataset.prices, dataset.train_split_end_date,
+              dataset.val_split_end_date, root / "prices.png")
+
+    train_and_evaluate(bench_params, model_params, dataset.splits, root, batched_eval=batched_eval)
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
@@ -312,6 +370,10 @@ if __name__ == '__main__':
                         help='Path to the benchmark configuration file')
     parser.add_argument('model', type=str,
                         help='Path to the model configuration file')
+    parser.add_argument('--batched-eval', action='store_true',
+                        help='Evaluate the test split with batched inference and a vectorized backtest')
+    parser.add_argument('--refresh-data', action='store_true',
+                        help='Reload and preprocess the data even if the dataset is cached')
     args = parser.parse_args()
 
     benchmark_path = (Path("parameters/benchmarks", args.benchmark + ".json")
@@ -348,4 +410,4 @@ if __name__ == '__main__':
 
     sys.excepthook = handler
 
-    main(benchmark_path, model_path)
+    main(benchmark_path, model_path, batched_eval=args.batched_eval, refresh_data=args.refresh_data)
@@ -7,9 +7,14 @@ export default class StockSense {
         return res.json();
     }
 
-    static async getSymbols(endpoint: string): Promise<string[]> {
+    static async getSymbols(endpoint: string, query: string = "", offset: number = 0, limit: number = 100): Promise<string[]> {
         const apiUrl = UserConfig.get('apiUrl');
-        const res = await fetch(`${apiUrl}/data/endpoints/${endpoint}/symbols`);
+        const params = new URLSearchParams({
+            q: query,
+            offset: offset.toString(),
+            limit: limit.toString()
+        });
+        const res = await fetch(`${apiUrl}/data/endpoints/${endpoint}/symbols?${params}`);
         return res.json();
     }
 
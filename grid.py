@@ -0,0 +1,181 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stderr, redirect_stdout
+import itertools
+import multiprocessing
+import os
+from pathlib import Path
+import time
+import traceback
+
+import pandas as pd
+
+from stockcore.dataset import load_dataset
+from stockcore.parameters import BenchParameters, ModelParameters
+import stockcore.environment as scenv
+import benchmark
+
+
+BENCHMARKS_DIR = Path("parameters/benchmarks")
+MODELS_DIR = Path("parameters/models")
+
+THREAD_VARIABLES = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+
+
+def run_name(benchmark_name: str, model_name: str, seed: int = None) -> str:
+    """Name of the output folder of a run, the one of `benchmark.py` when there is no seed"""
+    name = f"{benchmark_name}-{model_name}"
+    return name if seed is None else f"{name}-seed{seed}"
+
+
+def _init_worker(threads: int) -> None:
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+
+def _run(
+    benchmark_path: Path,
+    model_path: Path,
+    seed: int,
+    splits: dict[str, str],
+    batched_eval: bool
+) -> dict:
+    bench_params = BenchParameters.from_json(benchmark_path)
+    model_params = ModelParameters.from_json(model_path)
+    root = benchmark.build_folders(run_name(benchmark_path.stem, model_path.stem, seed))
+
+    # each run logs to its own file, so the output of parallel runs does not interleave
+    with open(root / "log.txt", "w") as log, redirect_stdout(log), redirect_stderr(log):
+        start = time.perf_counter()
+        try:
+            summary = benchmark.train_and_evaluate(
+                bench_params, model_params, splits, root, batched_eval=batched_eval, seed=seed)
+            status = "ok"
+        except Exception:
+            traceback.print_exc()
+            summary = {}
+            status = "failed"
+    return {"status": status, "seconds": time.perf_counter() - start, **summary}
+
+
+def publish_benchmark_data(benchmark_path: Path, roots: list[Path], refresh_data: bool = False) -> dict[str, str]:
+    """Load the dataset of a benchmark once, and publish its splits for the workers to attach to.
+
+    The price plot of `benchmark.py` is saved in each of `roots`.
+
+    Returns
+    -------
+    dict[str, str]
+        The name each split was published under, keyed by "train", "val" and "test"
+    """
+    bench_params = BenchParameters.from_json(benchmark_path)
+    dataset = load_dataset(bench_params.data, benchmark.load_data, refresh=refresh_data)
+    for root in roots:
+        benchmark.plot_data(dataset.prices, dataset.train_split_end_date, dataset.val_split_end_date,
+                            root / "prices.png")
+
+    names = {}
+    for split, data in dataset.splits.items():
+        names[split] = f"grid-{os.getpid()}-{benchmark_path.stem}-{split}"
+        scenv.publish_market_data(data, names[split])
+    return names
+
+
+def main(
+    benchmark_paths: list[Path],
+    model_paths: list[Path],
+    seeds: list[int],
+    workers: int,
+    threads: int,
+    batched_eval: bool,
+    output: Path,
+    refresh_data: bool = False
+) -> pd.DataFrame:
+    runs = list(itertools.product(benchmark_paths, model_paths, seeds))
+    print(f"Running {len(runs)} combinations on {workers} workers with {threads} torch thread(s) each")
+
+    # inherited by the workers before they import torch, so every native thread pool is pinned
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(threads)
+
+    published = []
+    rows = []
+    try:
+        print("Loading data...")
+        splits = {}
+        for benchmark_path in benchmark_paths:
+            roots = [benchmark.build_folders(run_name(benchmark_path.stem, model_path.stem, seed))
+                     for model_path in model_paths for seed in seeds]
+            splits[benchmark_path] = publish_benchmark_data(benchmark_path, roots, refresh_data)
+            published += splits[benchmark_path].values()
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(threads,)) as executor:
+            futures = {
+                executor.submit(_run, benchmark_path, model_path, seed, splits[benchmark_path], batched_eval):
+                    (benchmark_path.stem, model_path.stem, seed)
+                for benchmark_path, model_path, seed in runs
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                benchmark_name, model_name, seed = futures[future]
+                row = {"benchmark": benchmark_name, "model": model_name, "seed": seed, **future.result()}
+                rows.append(row)
+                name = run_name(benchmark_name, model_name, seed)
+                print(f"[{done}/{len(runs)}] {name}: {row['status']} in {row['seconds']:.0f}s"
+                      + (f", return {row['portfolio_return']:.2f}%" if row["status"] == "ok" else
+                         f", see {Path(benchmark.OUTPUT_DIR, name, 'log.txt')}"))
+    finally:
+        for name in published:
+            scenv.release_market_data(name)
+
+    results = pd.DataFrame(rows).sort_values(["benchmark", "model", "seed"], na_position="first")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(output, index=False)
+    print(results.to_string(index=False))
+    print(f"Results saved at {output}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run every benchmark configuration with every model configuration in parallel')
+    parser.add_argument('--benchmarks', type=str, nargs='+',
+                        help=f'Benchmark configurations to run, by default every file in {BENCHMARKS_DIR}')
+    parser.add_argument('--models', type=str, nargs='+',
+                        help=f'Model configurations to run, by default every file in {MODELS_DIR}')
+    parser.add_argument('--seeds', type=int, nargs='+',
+                        help='Seeds to run each combination with, by default a single unseeded run')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes, by default the number of CPUs divided by --threads')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Torch threads per worker, by default 1')
+    parser.add_argument('--batched-eval', action='store_true',
+                        help='Evaluate the test split with batched inference and a vectorized backtest')
+    parser.add_argument('--refresh-data', action='store_true',
+                        help='Reload and preprocess the data even if the datasets are cached')
+    parser.add_argument('--output', type=str, default=str(Path(benchmark.OUTPUT_DIR, "grid.csv")),
+                        help='Path of the consolidated results table')
+    args = parser.parse_args()
+
+    def resolve(names: list[str], directory: Path) -> list[Path]:
+        if names is None:
+            return sorted(directory.glob("*.json"))
+        paths = [Path(name) if name.endswith(".json") else directory / f"{name}.json" for name in names]
+        for path in paths:
+            if not path.exists():
+                available = [path.stem for path in directory.glob("*.json")]
+                parser.error(f"Configuration file {path} not found\nAvailable files: {available}")
+        return paths
+
+    main(
+        resolve(args.benchmarks, BENCHMARKS_DIR),
+        resolve(args.models, MODELS_DIR),
+        args.seeds or [None],
+        args.workers or max(1, (os.cpu_count() or 1) // args.threads),
+        args.threads,
+        args.batched_eval,
+        Path(args.output),
+        args.refresh_data
+    )
@@ -0,0 +1,526 @@
+import argparse
+import asyncio
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from stockcore.backtest import backtest
+from stockcore.data import FEATURE_COLUMNS, VOLUME_WINDOW, FeatureEngine, data_preprocess
+import stockcore.environment as scenv
+
+
+def synthetic_klines(n_symbols: int, length: int, seed: int = 0) -> list[pd.DataFrame]:
+    """Generate random-walk hourly K-line frames shaped like the endpoint output."""
+    rng = np.random.default_rng(seed)
+    unix = 1640995200000 + np.arange(length, dtype=np.int64) * 3600_000
+    dfs = []
+    for _ in range(n_symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, length)))
+        df = pd.DataFrame({
+            "unix": unix,
+            "open": close * (1 + rng.normal(0, 0.002, length)),
+            "high": close * 1.01,
+            "low": close * 0.99,
+            "close": close,
+            "volume": rng.uniform(1, 100, length),
+        }, index=pd.to_datetime(unix, unit="ms"))
+        df.index.name = "date"
+        dfs.append(df)
+    return dfs
+
+
+def bench_env(args):
+    dfs = synthetic_klines(args.symbols, args.length)
+    env = scenv.MultiStockTradingEnv(
+        dfs, windows=args.windows, trading_fees=0.0001, verbose=0)
+    actions = np.random.default_rng(1).integers(
+        0, env.action_space.n, env.get_dfs_length())
+
+    env.reset()
+    done, truncated = False, False
+    steps = 0
+    start = time.perf_counter()
+    while not done and not truncated:
+        _, _, done, truncated, _ = env.step(int(actions[steps]))
+        steps += 1
+    elapsed = time.perf_counter() - start
+    print(f"MultiStockTradingEnv: {steps} steps in {elapsed:.2f}s "
+          f"({steps / elapsed:,.0f} steps/s)")
+
+
+def bench_vecenv(args):
+    dfs = synthetic_klines(args.symbols, args.length)
+    env = scenv.MultiStockTradingEnv(
+        dfs, windows=args.windows, trading_fees=0.0001, verbose=0)
+    vec_env = scenv.VecMultiStockTradingEnv(env, args.n_envs)
+    actions = np.random.default_rng(1).integers(
+        0, env.action_space.n, (args.steps, args.n_envs))
+
+    vec_env.reset()
+    start = time.perf_counter()
+    for step in range(args.steps):
+        vec_env.step(actions[step])
+    elapsed = time.perf_counter() - start
+    transitions = args.steps * args.n_envs
+    print(f"VecMultiStockTradingEnv ({args.n_envs} envs): {transitions} transitions in {elapsed:.2f}s "
+          f"({transitions / elapsed:,.0f} transitions/s)")
+
+
+def bench_backtest(args):
+    dfs = synthetic_klines(args.symbols, args.length)
+    env = scenv.MultiStockTradingEnv(
+        dfs, windows=args.windows, trading_fees=0.001, verbose=0, strategy='buy_and_hold')
+    rng = np.random.default_rng(1)
+    start = args.windows - 1
+    steps = env.get_dfs_length() - 1 - start
+    n_assets = env.number_of_stocks + 1
+
+    # parity with the environment, on one-hot actions and on weights held for random stretches
+    actions = rng.integers(0, n_assets, (args.parity, steps))
+    weights = rng.dirichlet(np.ones(n_assets), (args.parity, steps))
+    hold = rng.random((args.parity, steps)) < 0.9
+    for step in range(1, steps):
+        weights[hold[:, step], step] = weights[hold[:, step], step - 1]
+    for strategy, targets in (('maximum_reward', actions), ('buy_and_hold', weights)):
+        env.strategy = strategy
+        result = backtest(env._price_array, targets, env.trading_fees, env.portfolio_initial_value, start)
+        for candidate in range(args.parity):
+            env.reset()
+            for step in range(steps):
+                env.step(targets[candidate, step])
+            if not np.allclose(env.get_history(), result.value[candidate], rtol=1e-9, atol=0):
+                raise AssertionError(f"backtest diverges from MultiStockTradingEnv ({strategy})")
+    print(f"parity with MultiStockTradingEnv: ok ({args.parity} candidates x 2 strategies, {steps} steps)")
+
+    actions = rng.integers(0, n_assets, (args.candidates, steps))
+    start_time = time.perf_counter()
+    result = backtest(env._price_array, actions, env.trading_fees, env.portfolio_initial_value, start)
+    elapsed = time.perf_counter() - start_time
+    print(f"backtest: {args.candidates} candidates x {steps} steps in {elapsed:.2f}s "
+          f"({args.candidates * steps / elapsed:,.0f} candidate steps/s), "
+          f"mean turnover {result.turnover.mean():.1f}, mean fees {result.fees.mean():.2f}")
+
+
+def bench_features(args):
+    df = synthetic_klines(1, args.length)[0]
+    rng = np.random.default_rng(1)
+    # few distinct volumes, so the rolling maximum has ties, and a decaying stretch, so maxima expire
+    df["volume"] = rng.integers(1, 20, len(df)).astype(np.float64)
+    decay = slice(len(df) // 2, len(df) // 2 + 2 * VOLUME_WINDOW)
+    df.iloc[decay, df.columns.get_loc("volume")] = np.linspace(1000, 1, 2 * VOLUME_WINDOW)
+    expected = data_preprocess(df, sort_by_date=False, dropna=False, inplace=False)[FEATURE_COLUMNS].to_numpy()
+    bars = df[["open", "high", "low", "close", "volume"]].to_dict("records")
+
+    # fed bar by bar from scratch, then seeded with a history shorter and longer than the volume window
+    for seeded in (0, VOLUME_WINDOW // 2, VOLUME_WINDOW + 1, len(df) // 3):
+        engine = FeatureEngine()
+        features = engine.seed(df.iloc[:seeded])[FEATURE_COLUMNS].to_numpy()
+        updated = np.array([[features[column] for column in FEATURE_COLUMNS]
+                            for features in map(engine.update, bars[seeded:])])
+        actual = np.concatenate([features, updated.reshape(-1, len(FEATURE_COLUMNS))])
+        if not np.array_equal(np.isnan(actual), np.isnan(expected)):
+            raise AssertionError(f"FeatureEngine leaves other values undefined than data_preprocess (seeded {seeded})")
+        if not np.allclose(actual, expected, rtol=1e-12, atol=0, equal_nan=True):
+            row = np.flatnonzero(~np.isclose(actual, expected, rtol=1e-12, atol=0, equal_nan=True).all(axis=1))[0]
+            raise AssertionError(f"FeatureEngine diverges from data_preprocess at row {row} (seeded {seeded})")
+    print(f"parity with data_preprocess(dropna=False): ok ({len(df)} bars, seeded with 0 to {len(df) // 3} bars)")
+
+    engine = FeatureEngine()
+    engine.seed(df.iloc[:args.history])
+    start = time.perf_counter()
+    for bar in bars[args.history:]:
+        engine.update(bar)
+    incremental = (time.perf_counter() - start) / (len(bars) - args.history)
+    start = time.perf_counter()
+    for _ in range(args.recomputes):
+        data_preprocess(df.iloc[:args.history], sort_by_date=False, dropna=False, inplace=False)
+    recompute = (time.perf_counter() - start) / args.recomputes
+    print(f"per new bar: FeatureEngine.update {incremental * 1e6:.1f} us, "
+          f"data_preprocess over {args.history} bars {recompute * 1e6:.0f} us")
+
+
+def bench_replay(args):
+    rng = np.random.default_rng(0)
+    states = rng.normal(size=(args.fill, args.state_size)).astype(np.float32)
+    actions = rng.integers(0, 9, args.fill)
+    rewards = rng.normal(size=args.fill).astype(np.float32)
+
+    memories = {
+        'ReplayMemory': scenv.ReplayMemory(args.capacity),
+        'ArrayReplayMemory': scenv.ArrayReplayMemory(args.capacity, seed=0),
+        'PrioritizedReplayMemory': scenv.PrioritizedReplayMemory(args.capacity, seed=0),
+    }
+    for name in list(memories):
+        memory = memories.pop(name)  # so only one memory is alive at a time
+        start = time.perf_counter()
+        for idx in range(args.fill - 1):
+            memory.push(states[idx], actions[idx], states[idx + 1], rewards[idx])
+        push_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.samples):
+            batch = memory.sample(args.batch_size)
+            if isinstance(memory, scenv.ReplayMemory):
+                # what the caller has to do before a training step
+                batch = scenv.Transition(*(np.stack(field) for field in zip(*batch)))
+            elif isinstance(memory, scenv.PrioritizedReplayMemory):
+                memory.update_priorities(batch.index, rng.random(args.batch_size))
+        sample_elapsed = time.perf_counter() - start
+        print(f"{name:>24}: {len(memory):,} transitions, push {push_elapsed / (args.fill - 1) * 1e6:.2f} us, "
+              f"sample of {args.batch_size} {sample_elapsed / args.samples * 1e6:,.0f} us")
+        del memory, batch
+
+
+def bench_act(args):
+    import torch
+    from stockcore.models import NaiveDQN
+
+    model = NaiveDQN(n_observations=args.observations, n_actions=args.actions).eval()
+    states = torch.randn(args.n_envs, args.observations)
+
+    def measure(act):
+        act()  # warm up
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            act()
+        return (time.perf_counter() - start) / args.steps * 1e6
+
+    per_state = measure(lambda: [model.act(states[idx:idx + 1], args.epsilon) for idx in range(args.n_envs)])
+    batched = measure(lambda: model.act(states, args.epsilon))
+    print(f"DQNBase.act for {args.n_envs} states (epsilon {args.epsilon}): one call per state {per_state:,.0f} us, "
+          f"one batched call {batched:,.0f} us per step")
+
+
+def bench_api(args):
+    import httpx
+
+    from stocksense.server import app
+    from stocksense.api.data.endpoint import Endpoint
+    from stocksense.api.data.router import endpoints
+    from stocksense.util.executor import network_pool, executor_stats
+
+    class SyntheticEndpoint(Endpoint):
+        """Serves random-walk bars, a download blocks for `delay` seconds like a slow SDK call"""
+
+        def __init__(self):
+            super().__init__("synthetic")
+            self.symbols = ["HOT", "COLD"]
+
+        def _download(self, symbol, since, until, timeframe):
+            time.sleep(args.delay)
+            df = synthetic_klines(1, args.length)[0]
+            self._kline_cache(symbol, timeframe).write(df, since, until)
+
+        async def _download_missing(self, symbol, since, until, timeframe):
+            if args.inline:
+                self._download(symbol, since, until, timeframe)
+            else:
+                await network_pool.run(self._download, symbol, since, until, timeframe)
+
+    since = 1640995200000
+    until = since + args.length * 3600_000
+
+    def params(symbol):
+        return {"symbol": symbol, "since": since, "until": until, "timeframe": "1h"}
+
+    async def measure(client, duration):
+        latencies = []
+        deadline = time.perf_counter() + duration
+
+        async def reader():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.get("/data/endpoints/synthetic/kline", params=params("HOT"))
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(reader() for _ in range(args.clients)))
+        return np.array(latencies) * 1000
+
+    def report(phase, latencies):
+        print(f"{phase:>24}: {len(latencies):5d} reads, p50 {np.percentile(latencies, 50):7.1f} ms, "
+              f"p99 {np.percentile(latencies, 99):7.1f} ms, max {latencies.max():7.1f} ms")
+
+    async def main():
+        endpoints["synthetic"] = SyntheticEndpoint()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.get("/data/endpoints/synthetic/kline", params=params("HOT"))
+            report("cached reads", await measure(client, args.duration))
+
+            async def cold_read():
+                await asyncio.sleep(args.duration / 4)
+                return await client.get("/data/endpoints/synthetic/kline", params=params("COLD"))
+
+            cold = asyncio.create_task(cold_read())
+            report("during cold download", await measure(client, args.duration))
+            print(f"{'pools':>24}: {executor_stats()}")
+            await cold
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as cache_root:
+        os.chdir(cache_root)
+        try:
+            asyncio.run(main())
+        finally:
+            os.chdir(cwd)
+
+
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import stocksense.server
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+TestClient(stocksense.server.app).get("/data/endpoints").raise_for_status()
+print(imported - start, time.perf_counter() - start)
+"""
+
+
+POLICY_LOAD_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import torch
+imported = time.perf_counter()
+from stockcore.policy import load_policy
+load_policy(sys.argv[1])
+print(imported - start, time.perf_counter() - imported, "stable_baselines3" in sys.modules)
+"""
+
+SB3_LOAD_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import torch
+imported = time.perf_counter()
+import stable_baselines3
+stable_baselines3.{algorithm}.load(sys.argv[1], device="cpu")
+print(imported - start, time.perf_counter() - imported, True)
+"""
+
+
+def bench_policy(args):
+    from stable_baselines3 import A2C, DQN
+    from stockcore.policy import export_policy, load_policy
+
+    env = scenv.MultiStockTradingEnv(
+        synthetic_klines(args.symbols, args.length), windows=args.windows, trading_fees=0.0001, verbose=0)
+    observations = env.get_observations()
+    python_path = os.pathsep.join([os.path.dirname(os.path.abspath(__file__)), os.environ.get("PYTHONPATH", "")])
+
+    def cold_load(script, path):
+        times = [list(map(eval, subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", script, str(path)], env=dict(os.environ, PYTHONPATH=python_path),
+            capture_output=True, text=True, check=True).stdout.split()[-3:])) for _ in range(args.runs)]
+        return np.median([t[0] for t in times]) * 1000, np.median([t[1] for t in times]) * 1000, times[0][2]
+
+    def latency(predict):
+        latencies = []
+        for idx in range(args.decisions):
+            start = time.perf_counter()
+            predict(observations[idx % len(observations)])
+            latencies.append(time.perf_counter() - start)
+        latencies = np.array(latencies) * 1e6
+        return f"p50 {np.percentile(latencies, 50):6.0f} us, p99 {np.percentile(latencies, 99):6.0f} us"
+
+    with tempfile.TemporaryDirectory() as root:
+        for algorithm in (DQN, A2C):
+            name = algorithm.__name__
+            model = algorithm('MlpPolicy', env, device="cpu", seed=0)
+            model.learn(args.timesteps)
+            model.save(Path(root, name))
+            path = export_policy(model, Path(root, f"{name}-policy"), env.get_feature_columns())
+            policy = load_policy(path)
+
+            expected = model.predict(observations, deterministic=True)[0]
+            if not np.array_equal(policy.predict(observations), expected):
+                raise AssertionError(f"exported {name} policy diverges from model.predict")
+            print(f"{name}: exported policy matches model.predict on {len(observations)} observations")
+
+            torch_ms, load_ms, sb3 = cold_load(POLICY_LOAD_SCRIPT, path)
+            print(f"{'cold load, exported':>24}: {load_ms:7.1f} ms after importing torch ({torch_ms:.0f} ms), "
+                  f"stable_baselines3 imported: {sb3}")
+            torch_ms, load_ms, _ = cold_load(SB3_LOAD_SCRIPT.format(algorithm=name), Path(root, f"{name}.zip"))
+            print(f"{'cold load, SB3':>24}: {load_ms:7.1f} ms after importing torch ({torch_ms:.0f} ms)")
+            print(f"{'decision, exported':>24}: {latency(policy.predict)}")
+            print(f"{'decision, SB3':>24}: {latency(lambda obs: model.predict(obs, deterministic=True))}")
+
+
+def bench_pilot(args):
+    import httpx
+    from stable_baselines3 import DQN
+
+    from stockcore.policy import export_policy
+    from stocksense.server import app
+    from stocksense.api.pilot.registry import model_registry
+
+    env = scenv.MultiStockTradingEnv(
+        synthetic_klines(args.symbols, args.length), windows=args.windows, trading_fees=0.0001, verbose=0)
+    observations = np.array(env.get_observations())
+
+    async def measure(client, duration):
+        latencies = []
+        deadline = time.perf_counter() + duration
+
+        async def trader(offset):
+            idx = offset
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.post("/pilot/models/bench-dqn/decide",
+                                             json={"observation": observations[idx % len(observations)].tolist()})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+                idx += args.clients
+
+        await asyncio.gather(*(trader(offset) for offset in range(args.clients)))
+        return np.array(latencies) * 1000
+
+    async def main(policy):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            responses = await asyncio.gather(*(
+                client.post("/pilot/models/bench-dqn/decide", json={"observation": observation.tolist()})
+                for observation in observations[:args.parity]))
+            served = np.array([response.json()["action"] for response in responses])
+            if not np.array_equal(served, policy.predict(observations[:args.parity])):
+                raise AssertionError("served actions diverge from the exported policy")
+            print(f"served actions match the exported policy on {args.parity} concurrent decisions")
+
+            for max_batch_size in (1, args.max_batch_size):
+                model_registry.unload("bench-dqn")
+                model_registry.batcher_options = {"max_batch_size": max_batch_size, "max_wait": args.max_wait / 1000}
+                await client.get("/pilot/models/bench-dqn")
+                latencies = await measure(client, args.duration)
+                stats = (await client.get("/pilot/stats")).json()["models"]["bench-dqn"]
+                print(f"{f'max batch size {max_batch_size}':>24}: {len(latencies) / args.duration:7.0f} decisions/s, "
+                      f"request p50 {np.percentile(latencies, 50):5.1f} ms, p99 {np.percentile(latencies, 99):5.1f} ms; "
+                      f"queue to action p50 {stats['p50_ms']:5.2f} ms, p99 {stats['p99_ms']:5.2f} ms, "
+                      f"mean batch {stats['mean_batch_size']:5.1f}")
+
+    with tempfile.TemporaryDirectory() as root:
+        model = DQN('MlpPolicy', env, device="cpu", seed=0)
+        model.learn(args.timesteps)
+        path = export_policy(model, Path(root, "bench-dqn", "policy"), env.get_feature_columns())
+        model_registry.root = Path(root)
+        from stockcore.policy import load_policy
+        asyncio.run(main(load_policy(path)))
+
+
+def bench_startup(args):
+    import_times, ready_times = [], []
+    with tempfile.TemporaryDirectory() as cache_root:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            [os.path.dirname(os.path.abspath(__file__)), os.environ.get("PYTHONPATH", "")]))
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, "-c", STARTUP_SCRIPT], cwd=cache_root, env=env,
+                capture_output=True, text=True, check=True).stdout
+            imported, ready = map(float, output.split()[-2:])
+            import_times.append(imported)
+            ready_times.append(ready)
+    print(f"import stocksense.server: median {np.median(import_times) * 1000:.0f} ms, "
+          f"first /data/endpoints response: median {np.median(ready_times) * 1000:.0f} ms "
+          f"({args.runs} runs)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Micro-benchmarks for the StockSense hot paths')
+    subparsers = parser.add_subparsers(required=True)
+
+    env_parser = subparsers.add_parser(
+        'env', help='Steps per second of MultiStockTradingEnv with random actions')
+    env_parser.add_argument('--symbols', type=int, default=8)
+    env_parser.add_argument('--length', type=int, default=20000)
+    env_parser.add_argument('--windows', type=int, default=5)
+    env_parser.set_defaults(func=bench_env)
+
+    vecenv_parser = subparsers.add_parser(
+        'vecenv', help='Transitions per second of VecMultiStockTradingEnv with random actions')
+    vecenv_parser.add_argument('--symbols', type=int, default=8)
+    vecenv_parser.add_argument('--length', type=int, default=20000)
+    vecenv_parser.add_argument('--windows', type=int, default=5)
+    vecenv_parser.add_argument('--n-envs', type=int, default=256)
+    vecenv_parser.add_argument('--steps', type=int, default=2000)
+    vecenv_parser.set_defaults(func=bench_vecenv)
+
+    features_parser = subparsers.add_parser(
+        'features', help='Check FeatureEngine against data_preprocess bar by bar, then time one update')
+    features_parser.add_argument('--length', type=int, default=2000)
+    features_parser.add_argument('--history', type=int, default=1000, help='bars seeded before timing')
+    features_parser.add_argument('--recomputes', type=int, default=50)
+    features_parser.set_defaults(func=bench_features)
+
+    replay_parser = subparsers.add_parser(
+        'replay', help='Push and sample cost of the replay memories, sampling includes stacking the batch '
+                       'for ReplayMemory and updating the priorities for PrioritizedReplayMemory')
+    replay_parser.add_argument('--capacity', type=int, default=1_000_000)
+    replay_parser.add_argument('--fill', type=int, default=1_000_000, help='transitions pushed')
+    replay_parser.add_argument('--state-size', type=int, default=40)
+    replay_parser.add_argument('--batch-size', type=int, default=128)
+    replay_parser.add_argument('--samples', type=int, default=200)
+    replay_parser.set_defaults(func=bench_replay)
+
+    act_parser = subparsers.add_parser(
+        'act', help='Epsilon-greedy action selection of DQNBase, per state against batched')
+    act_parser.add_argument('--n-envs', type=int, default=256)
+    act_parser.add_argument('--observations', type=int, default=40)
+    act_parser.add_argument('--actions', type=int, default=9)
+    act_parser.add_argument('--epsilon', type=float, default=0.1)
+    act_parser.add_argument('--steps', type=int, default=20)
+    act_parser.set_defaults(func=bench_act)
+
+    backtest_parser = subparsers.add_parser(
+        'backtest', help='Check stockcore.backtest against MultiStockTradingEnv, then time many candidates')
+    backtest_parser.add_argument('--symbols', type=int, default=8)
+    backtest_parser.add_argument('--length', type=int, default=5000)
+    backtest_parser.add_argument('--windows', type=int, default=5)
+    backtest_parser.add_argument('--parity', type=int, default=4, help='candidates replayed in the env')
+    backtest_parser.add_argument('--candidates', type=int, default=2000)
+    backtest_parser.set_defaults(func=bench_backtest)
+
+    api_parser = subparsers.add_parser(
+        'api', help='Latency of cached K-line reads through the API while a slow download is in flight')
+    api_parser.add_argument('--length', type=int, default=2000, help='bars per read')
+    api_parser.add_argument('--clients', type=int, default=8, help='concurrent readers')
+    api_parser.add_argument('--duration', type=float, default=2.0, help='seconds per phase')
+    api_parser.add_argument('--delay', type=float, default=3.0, help='seconds the cold download blocks')
+    api_parser.add_argument('--inline', action='store_true',
+                            help='run the blocking download on the event loop, for comparison')
+    api_parser.set_defaults(func=bench_api)
+
+    policy_parser = subparsers.add_parser(
+        'policy', help='Cold load time and decision latency of exported policies against SB3 models')
+    policy_parser.add_argument('--symbols', type=int, default=8)
+    policy_parser.add_argument('--length', type=int, default=2000)
+    policy_parser.add_argument('--windows', type=int, default=5)
+    policy_parser.add_argument('--timesteps', type=int, default=1000, help='training steps before export')
+    policy_parser.add_argument('--runs', type=int, default=3, help='fresh interpreters per cold load')
+    policy_parser.add_argument('--decisions', type=int, default=2000)
+    policy_parser.set_defaults(func=bench_policy)
+
+    pilot_parser = subparsers.add_parser(
+        'pilot', help='Decisions per second served by /pilot, without batching against micro-batched')
+    pilot_parser.add_argument('--symbols', type=int, default=8)
+    pilot_parser.add_argument('--length', type=int, default=2000)
+    pilot_parser.add_argument('--windows', type=int, default=5)
+    pilot_parser.add_argument('--timesteps', type=int, default=1000, help='training steps before export')
+    pilot_parser.add_argument('--parity', type=int, default=256, help='decisions checked against the policy')
+    pilot_parser.add_argument('--clients', type=int, default=64, help='concurrent traders')
+    pilot_parser.add_argument('--duration', type=float, default=3.0, help='seconds per configuration')
+    pilot_parser.add_argument('--max-batch-size', type=int, default=256)
+    pilot_parser.add_argument('--max-wait', type=float, default=2.0, help='milliseconds')
+    pilot_parser.set_defaults(func=bench_pilot)
+
+    startup_parser = subparsers.add_parser(
+        'startup', help='Cold start time of the API server, in fresh interpreters')
+    startup_parser.add_argument('--runs', type=int, default=5)
+    startup_parser.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -3,12 +3,13 @@ import matplotlib.pyplot as plt
 import os
 from datetime import datetime
 
-def test_format(x) -> bool:
-    benchmark, model = x.split('-')
-    if benchmark in ['stock1', 'stock2', 'crypto'] and model in ["a2c", "dqn_short", "dqn_long"]:
-        return True
-    else:
-        return False
+def discover_models() -> list[str]:
+    """Names of the runs in the output folder that have results, e.g. stock1-dqn_short or stock1-a2c-seed0"""
+    if not os.path.isdir("output"):
+        return []
+    return sorted(
+        name for name in os.listdir("output")
+        if os.path.exists(os.path.join("output", name, "results.csv")))
 
 def read_model(models: list):
     results = {}
@@ -40,21 +41,26 @@ def show_plot(dfs):
 
 
 def main():
+    available = discover_models()
+    if not available:
+        print("No results found in output/, run benchmark.py or grid.py first.")
+        return
+    print(f"Available: {' '.join(available)}")
     models = []
     while True:
         err = ""
         try:
             model_list = input("Enter the models you want to compare (ex. stock1-dqn_short), and seperate with space or 'all': \n").split()
             if model_list[0] == "all":
-                models = ["stock1-a2c", "stock1-dqn_short", "stock1-dqn_long", "stock2-a2c", "stock2-dqn_short", "stock2-dqn_long"]
+                models = available
                 break
             for x in model_list:
                 err = x
-                assert test_format(x)
+                assert x in available
                 models.append(x)
             break
         except AssertionError:
-            print(f"{err} is with wrong format. Try again !")
+            print(f"{err} has no results. Try again !")
     res = read_model(models)
     # print(res)
     show_plot(res)
@@ -0,0 +1,152 @@
+from dataclasses import dataclass
+
+import numpy as _np
+
+from stockcore.environment.customenv import rebalance
+
+
+__all__ = ["BacktestResult", "backtest"]
+
+
+@dataclass
+class BacktestResult:
+    """Outcome of :func:`backtest` for each candidate schedule.
+
+    Attributes
+    ----------
+    value : np.ndarray
+        Portfolio value of shape ``(..., steps + 1)``, the first one being the initial value.
+        This is what `MultiStockTradingEnv.get_history` records.
+    turnover : np.ndarray
+        Sum over trades of the traded value divided by the portfolio value before the trade, shape ``(...)``
+    fees : np.ndarray
+        Total value paid in trading fees, shape ``(...)``
+    trades : np.ndarray
+        Number of steps at which the portfolio was rebalanced, shape ``(...)``
+    """
+    value: _np.ndarray
+    turnover: _np.ndarray
+    fees: _np.ndarray
+    trades: _np.ndarray
+
+    @property
+    def rewards(self) -> _np.ndarray:
+        """Log return of each step, the rewards of `MultiStockTradingEnv`, shape ``(..., steps)``"""
+        with _np.errstate(divide='ignore', invalid='ignore'):
+            return _np.diff(_np.log(self.value), axis=-1)
+
+    @property
+    def total_return(self) -> _np.ndarray:
+        """Final value over initial value minus one, shape ``(...)``"""
+        return self.value[..., -1] / self.value[..., 0] - 1
+
+
+def backtest(
+    price: _np.ndarray,
+    targets: _np.ndarray,
+    trading_fees: float = 0,
+    portfolio_initial_value: float = 1000,
+    start: int = 0
+) -> BacktestResult:
+    """Replay target weight schedules over a price matrix, for many candidates at once.
+
+    Follows `MultiStockTradingEnv` step by step: the portfolio starts in cash at index `start`, and at each
+    step is rebalanced with :func:`rebalance` at the current prices, only if the targets differ from the
+    previous ones, before being valued at the next prices. The candidates are simulated together on
+    ``(K, n_stocks)`` arrays, and only the steps at which some candidate trades are visited one by one:
+    the value in between is one matrix product per stretch. The cost thus grows with the number of
+    trading steps, hardly with the number of candidates.
+
+    Parameters
+    ----------
+    price : np.ndarray
+        Close prices of shape ``(T, n_stocks)``, e.g. `MarketData.price`
+    targets : np.ndarray
+        Either target percentages of stocks and cash of shape ``(..., steps, n_stocks + 1)``, as taken
+        by the ``buy_and_hold`` strategy, or integer actions of shape ``(..., steps)`` as taken by the
+        ``maximum_reward`` strategy, i.e. the index of the only stock (or cash, ``n_stocks``) to hold.
+        Leading dimensions index the candidates.
+    trading_fees : float, optional
+        Fee rate charged on the traded value, by default 0
+    portfolio_initial_value : float, optional
+        Initial value of every portfolio, by default 1000
+    start : int, optional
+        Index of `price` the first step trades at, by default 0.
+        Use ``windows - 1`` to match an environment with observation windows.
+
+    Returns
+    -------
+    BacktestResult
+        Values, turnover, fees and number of trades of each candidate
+    """
+    price = _np.asarray(price, dtype=_np.float64)
+    targets = _np.asarray(targets)
+    n_assets = price.shape[1] + 1
+    discrete = _np.issubdtype(targets.dtype, _np.integer)
+
+    batch_shape = targets.shape[:-1] if discrete else targets.shape[:-2]
+    steps = targets.shape[-1] if discrete else targets.shape[-2]
+    if not discrete and targets.shape[-1] != n_assets:
+        raise ValueError(f"Expected {n_assets} target percentages per step, got {targets.shape[-1]}.")
+    if start + steps >= len(price):
+        raise ValueError(f"{steps} steps from index {start} go past the {len(price)} prices.")
+
+    n = int(_np.prod(batch_shape, dtype=_np.int64))
+    targets = targets.reshape(n, steps) if discrete else targets.reshape(n, steps, n_assets)
+
+    percentages = _np.zeros((n, n_assets))
+    percentages[:, -1] = 1  # 1 for cash
+    held = _np.full(n, n_assets - 1)
+    amount_of_stocks = _np.zeros((n, n_assets - 1))
+    cash = _np.full(n, float(portfolio_initial_value))
+    value = _np.empty((n, steps + 1))
+    value[:, 0] = portfolio_initial_value
+    turnover = _np.zeros(n)
+    fees = _np.zeros(n)
+    trades = _np.zeros(n, dtype=_np.int64)
+
+    # steps at which at least one candidate trades, the others only revalue the same holdings
+    if discrete:
+        previous = _np.concatenate([held[:, None], targets[:, :-1]], axis=1)
+        trading = (targets != previous).any(axis=0)
+    else:
+        previous = _np.concatenate([percentages[:, None], targets[:, :-1]], axis=1)
+        trading = (targets != previous).any(axis=(0, 2))
+    del previous
+
+    filled = 1  # value[:, :filled] is known
+    for step in _np.flatnonzero(trading):
+        value[:, filled:step + 1] = amount_of_stocks @ price[start + filled:start + step + 1].T + cash[:, None]
+        filled = step + 1
+
+        prices_of_stocks = price[start + step]
+        if discrete:
+            # one-hot targets differ exactly when the held asset does
+            changed = _np.flatnonzero(targets[:, step] != held)
+            held[changed] = targets[changed, step]
+            new_percentages = _np.zeros((len(changed), n_assets))
+            new_percentages[_np.arange(len(changed)), held[changed]] = 1
+        else:
+            changed = _np.flatnonzero((targets[:, step] != percentages).any(axis=1))
+            new_percentages = targets[changed, step].astype(_np.float64)
+            percentages[changed] = new_percentages
+
+        before = amount_of_stocks[changed]
+        total_before = before @ prices_of_stocks + cash[changed]
+        after, cash[changed] = rebalance(
+            before, cash[changed], new_percentages, prices_of_stocks, trading_fees)
+        amount_of_stocks[changed] = after
+
+        with _np.errstate(divide='ignore', invalid='ignore'):
+            turnover[changed] += _np.abs(after - before) @ prices_of_stocks / total_before
+        fees[changed] += total_before - (after @ prices_of_stocks + cash[changed])
+        trades[changed] += 1
+
+    value[:, filled:] = amount_of_stocks @ price[start + filled:start + steps + 1].T + cash[:, None]
+
+    return BacktestResult(
+        value=value.reshape(*batch_shape, steps + 1),
+        turnover=turnover.reshape(batch_shape),
+        fees=fees.reshape(batch_shape),
+        trades=trades.reshape(batch_shape)
+    )
@@ -1,7 +1,24 @@
+from collections import deque
+from typing import Mapping
+
 import pandas as _pd
 
 
-__all__ = ["data_preprocess"]
+__all__ = ["data_preprocess", "FeatureEngine", "FEATURE_COLUMNS", "FEATURES_VERSION"]
+
+VOLUME_WINDOW = 7 * 24
+
+FEATURES_VERSION = 1
+"""Version of the feature pipeline, bump it whenever :func:`data_preprocess` changes to invalidate cached datasets"""
+
+FEATURE_COLUMNS = [
+    "feature_close",
+    "feature_open",
+    "feature_high",
+    "feature_low",
+    "feature_volume",
+]
+
 
 def data_preprocess(
     df: _pd.DataFrame,
@@ -31,9 +48,84 @@ def data_preprocess(
     df["feature_low"] = df["low"] / df["close"]
 
     # Create the feature : volume[t] / max(*volume[t-7*24:t+1])
-    df["feature_volume"] = df["volume"] / df["volume"].rolling(7 * 24).max()
+    df["feature_volume"] = df["volume"] / df["volume"].rolling(VOLUME_WINDOW).max()
 
     if dropna:
         df.dropna(inplace=True)  # Clean again !
 
     return df
+
+
+class FeatureEngine:
+    """Compute the features of :func:`data_preprocess` incrementally, one bar at a time.
+
+    The engine is seeded with the history of a symbol, then fed each new closed bar with :meth:`update`,
+    which costs O(1) amortized time. The rolling volume maximum is kept in a monotonic deque.
+    """
+
+    def __init__(self) -> None:
+        self._prev_close: float = None
+        self._n_bars = 0
+        # (bar number, volume) pairs with strictly decreasing volumes, the front is the window maximum
+        self._volume_max: deque[tuple[int, float]] = deque()
+
+    def seed(self, df: _pd.DataFrame) -> _pd.DataFrame:
+        """Reset the engine with the history of a symbol.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            K-line data sorted by date, with columns open, high, low, close and volume
+
+        Returns
+        -------
+        pd.DataFrame
+            `df` with the feature columns, exactly as :func:`data_preprocess` with ``dropna=False`` computes them
+        """
+        df = data_preprocess(df, sort_by_date=False, dropna=False, inplace=False)
+
+        self._prev_close = None
+        self._n_bars = 0
+        self._volume_max.clear()
+        if len(df) > 0:
+            self._prev_close = df["close"].iloc[-1]
+            self._n_bars = len(df) - min(len(df), VOLUME_WINDOW)
+            for volume in df["volume"].iloc[-VOLUME_WINDOW:]:
+                self._push_volume(volume)
+        return df
+
+    def _push_volume(self, volume: float) -> float:
+        while self._volume_max and self._volume_max[-1][1] <= volume:
+            self._volume_max.pop()
+        self._volume_max.append((self._n_bars, volume))
+        while self._volume_max[0][0] <= self._n_bars - VOLUME_WINDOW:
+            self._volume_max.popleft()
+        self._n_bars += 1
+        return self._volume_max[0][1]
+
+    def update(self, bar: Mapping[str, float]) -> dict[str, float]:
+        """Feed the next closed bar.
+
+        Parameters
+        ----------
+        bar : Mapping[str, float]
+            The new bar, e.g. a row of K-line data, with keys open, high, low, close and volume
+
+        Returns
+        -------
+        dict[str, float]
+            The features of the new bar, keyed by :data:`FEATURE_COLUMNS`. Values that
+            :func:`data_preprocess` leaves undefined (not enough history yet) are NaN.
+        """
+        close = bar["close"]
+        volume_max = self._push_volume(bar["volume"])
+
+        features = {
+            "feature_close": float("nan") if self._prev_close is None else close / self._prev_close - 1,
+            "feature_open": bar["open"] / close,
+            "feature_high": bar["high"] / close,
+            "feature_low": bar["low"] / close,
+            "feature_volume": bar["volume"] / volume_max if self._n_bars >= VOLUME_WINDOW else float("nan"),
+        }
+        self._prev_close = close
+        return features
@@ -0,0 +1,194 @@
+from dataclasses import asdict, dataclass
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import Callable
+
+import numpy as _np
+import pandas as _pd
+
+import stockcore.data as _scdata
+from stockcore.environment.market import MarketData
+from stockcore.parameters import DataParameters
+
+
+__all__ = [
+    'Dataset',
+    'split_data',
+    'dataset_key',
+    'load_dataset',
+]
+
+DATASET_DIR = Path("cache", "datasets")
+"""Where preprocessed datasets are cached"""
+
+SPLITS = ("train", "val", "test")
+
+
+def split_data(
+    df_dict: dict[str, _pd.DataFrame],
+    data_params: DataParameters
+) -> tuple[dict[str, list[_pd.DataFrame]], _pd.Timestamp, _pd.Timestamp]:
+    """Split the data into train, val and test sets by date.
+
+    Returns
+    -------
+    tuple[dict[str, list[pd.DataFrame]], pd.Timestamp, pd.Timestamp]
+        The frames of each set keyed by "train", "val" and "test", and the end dates of the train and val sets
+    """
+    dfs = list(df_dict.values())
+
+    # make sure all the dataframes have the same length
+    assert all(df.index.equals(dfs[0].index)
+               for df in dfs), "Dataframes have different datetime indices"
+
+    train_split_end = int(data_params.train_ratio * len(dfs[0]))
+    train_split_end_date = dfs[0].index[train_split_end]
+    val_split_end = int(
+        (data_params.train_ratio + data_params.val_ratio) * len(dfs[0]))
+    val_split_end_date = dfs[0].index[val_split_end]
+
+    splits = {
+        "train": [df[:train_split_end_date] for df in dfs],
+        "val": [df[train_split_end_date:val_split_end_date] for df in dfs],
+        "test": [df[val_split_end_date:] for df in dfs],
+    }
+    return splits, train_split_end_date, val_split_end_date
+
+
+def dataset_key(data_params: DataParameters) -> str:
+    """Hash of the data parameters and of :data:`stockcore.data.FEATURES_VERSION`, naming a cached dataset"""
+    description = json.dumps(
+        {"data": asdict(data_params), "features_version": _scdata.FEATURES_VERSION},
+        sort_keys=True, default=str)
+    return hashlib.sha256(description.encode()).hexdigest()[:16]
+
+
+@dataclass
+class Dataset:
+    """Preprocessed train, val and test sets of a benchmark.
+
+    Attributes
+    ----------
+    splits : dict[str, MarketData]
+        Market data of each set, keyed by "train", "val" and "test"
+    train_split_end_date : pd.Timestamp
+        End of the train set
+    val_split_end_date : pd.Timestamp
+        End of the val set
+    prices : dict[str, pd.DataFrame]
+        Close prices of each symbol over the whole period, in a "close" column
+    """
+    splits: dict[str, MarketData]
+    train_split_end_date: _pd.Timestamp
+    val_split_end_date: _pd.Timestamp
+    prices: dict[str, _pd.DataFrame]
+
+    @staticmethod
+    def from_dfs(df_dict: dict[str, _pd.DataFrame], data_params: DataParameters) -> "Dataset":
+        """Split and preprocess K-line data as returned by the data endpoints"""
+        splits, train_split_end_date, val_split_end_date = split_data(df_dict, data_params)
+        return Dataset(
+            splits={split: MarketData.from_dfs(dfs) for split, dfs in splits.items()},
+            train_split_end_date=train_split_end_date,
+            val_split_end_date=val_split_end_date,
+            prices={symbol: df[["close"]] for symbol, df in df_dict.items()}
+        )
+
+    def save(self, path: str | Path) -> None:
+        """Save the dataset in directory `path`.
+
+        The splits are concatenated into a single `MarketData`, and the directory is written next to its
+        final location then renamed, so readers never observe a partially written dataset.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(tempfile.mkdtemp(prefix=f".{path.name}-", dir=path.parent))
+        try:
+            splits = [self.splits[split] for split in SPLITS]
+            bounds = _np.cumsum([0] + [len(data) for data in splits]).tolist()
+            MarketData(
+                obs=_np.concatenate([data.obs for data in splits]),
+                price=_np.concatenate([data.price for data in splits]),
+                date=_np.concatenate([data.date for data in splits]),
+                feature_columns=splits[0].feature_columns
+            ).save(tmp_path / "market")
+
+            prices = _pd.concat({symbol: df["close"] for symbol, df in self.prices.items()}, axis=1)
+            _np.save(tmp_path / "close.npy", prices.to_numpy(dtype=_np.float64))
+            _np.save(tmp_path / "date.npy", prices.index.to_numpy(dtype="datetime64[ns]"))
+            with open(tmp_path / "meta.json", "w") as file:
+                json.dump({
+                    "splits": {split: bounds[idx:idx + 2] for idx, split in enumerate(SPLITS)},
+                    "train_split_end_date": self.train_split_end_date.isoformat(),
+                    "val_split_end_date": self.val_split_end_date.isoformat(),
+                    "symbols": list(self.prices),
+                }, file)
+            if path.exists():
+                shutil.rmtree(path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def load(path: str | Path) -> "Dataset":
+        """Load a dataset saved with :meth:`save`, memory-mapping its arrays read-only"""
+        path = Path(path)
+        with open(path / "meta.json", "r") as file:
+            meta = json.load(file)
+        market = MarketData.load(path / "market", mmap=True)
+        close = _np.load(path / "close.npy", mmap_mode="r")
+        date = _pd.DatetimeIndex(_np.load(path / "date.npy"), name="date")
+        return Dataset(
+            splits={
+                split: MarketData(
+                    obs=market.obs[start:end],
+                    price=market.price[start:end],
+                    date=market.date[start:end],
+                    feature_columns=market.feature_columns
+                )
+                for split, (start, end) in meta["splits"].items()
+            },
+            train_split_end_date=_pd.Timestamp(meta["train_split_end_date"]),
+            val_split_end_date=_pd.Timestamp(meta["val_split_end_date"]),
+            prices={symbol: _pd.DataFrame({"close": close[:, idx]}, index=date)
+                    for idx, symbol in enumerate(meta["symbols"])}
+        )
+
+
+def load_dataset(
+    data_params: DataParameters,
+    load_data: Callable[[DataParameters], dict[str, _pd.DataFrame]],
+    root: str | Path = DATASET_DIR,
+    refresh: bool = False
+) -> Dataset:
+    """Load the dataset described by `data_params` from the cache, building and caching it on a miss.
+
+    A cached dataset is found by :func:`dataset_key`, so it is reused as long as neither the data parameters
+    nor the feature pipeline change. Data whose period reaches into the future keeps the bars it was built
+    with until `refresh` is set.
+
+    Parameters
+    ----------
+    data_params : DataParameters
+        The data to load
+    load_data : Callable[[DataParameters], dict[str, pd.DataFrame]]
+        Loads the K-line data of each symbol on a cache miss
+    root : str | Path, optional
+        Directory holding cached datasets, by default :data:`DATASET_DIR`
+    refresh : bool, optional
+        Whether to rebuild the dataset even if it is cached, by default False
+
+    Returns
+    -------
+    Dataset
+        The dataset, with memory-mapped arrays
+    """
+    path = Path(root, dataset_key(data_params))
+    if refresh or not (path / "meta.json").exists():
+        Dataset.from_dfs(load_data(data_params), data_params).save(path)
+    return Dataset.load(path)
@@ -1,11 +1,23 @@
-from .memory import ReplayMemory, Transition
+from .memory import (ReplayMemory, ArrayReplayMemory, PrioritizedReplayMemory,
+                     Transition, TransitionBatch, PrioritizedTransitionBatch)
 from .gymenv import make_trading_env, make_multi_dataset_trading_env
 from .customenv import MultiStockTradingEnv
+from .vecenv import VecMultiStockTradingEnv
+from .market import MarketData, publish_market_data, attach_market_data, release_market_data
 
 __all__ = [
     'ReplayMemory',
+    'ArrayReplayMemory',
+    'PrioritizedReplayMemory',
     'Transition',
+    'TransitionBatch',
+    'PrioritizedTransitionBatch',
     'make_trading_env',
-    'make_multi_dataset_trading_env'
-    'MultiStockTradingEnv'
+    'make_multi_dataset_trading_env',
+    'MultiStockTradingEnv',
+    'VecMultiStockTradingEnv',
+    'MarketData',
+    'publish_market_data',
+    'attach_market_data',
+    'release_market_data'
 ]
\ No newline at end of file
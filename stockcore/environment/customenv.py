@@ -2,7 +2,8 @@ import gymnasium as _gym
 from gymnasium import spaces
 import pandas as _pd
 import numpy as _np
-import stockcore.data as _scdata
+
+from .market import MarketData, attach_market_data
 
 
 class History:
@@ -21,44 +22,78 @@ class History:
         return self.total_assets_list
 
 
+def rebalance(amount_of_stocks, cash, percentages_of_stocks_and_cash, prices_of_stocks, trading_fees):
+    """Trade a portfolio to new target percentages, charging `trading_fees` on each trade.
+
+    All arguments broadcast over leading dimensions, so a batch of portfolios of shape
+    ``(..., n_stocks)`` can be rebalanced at once.
+
+    Parameters
+    ----------
+    amount_of_stocks : np.ndarray
+        Amount of each stock held, shape ``(..., n_stocks)``
+    cash : np.ndarray | float
+        Cash held, shape ``(...)``
+    percentages_of_stocks_and_cash : np.ndarray
+        Target percentages, shape ``(..., n_stocks + 1)``, the last one being cash
+    prices_of_stocks : np.ndarray
+        Current prices, shape ``(..., n_stocks)``
+    trading_fees : float
+        Fee rate charged on the traded value
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The new amount of stocks and the new cash.
+    """
+    percentages = percentages_of_stocks_and_cash[..., :-1]
+    total_money = (amount_of_stocks * prices_of_stocks).sum(axis=-1) + cash
+    stock_trade = percentages * total_money[..., None] / prices_of_stocks - amount_of_stocks
+    buy = stock_trade > 0
+    stock_trade = _np.where(
+        buy,
+        stock_trade / (1 - trading_fees + trading_fees * percentages),
+        stock_trade / (1 - trading_fees * percentages))
+    cash_trade = - stock_trade * prices_of_stocks
+    amount_of_stocks = amount_of_stocks + _np.where(buy, stock_trade * (1 - trading_fees), stock_trade)
+    cash = cash + _np.where(buy, cash_trade, cash_trade * (1 - trading_fees)).sum(axis=-1)
+    return amount_of_stocks, cash
+
+
 class Portfolio:
     def __init__(self, percentages_of_stocks_and_cash, total_money, prices_of_stocks):
-        self.amount_of_stocks = []
-        for idx, percentage in enumerate(percentages_of_stocks_and_cash[:-1]):
-            self.amount_of_stocks.append(
-                percentage * total_money / prices_of_stocks[idx])
-        self.cash = percentages_of_stocks_and_cash[-1] * total_money
+        percentages_of_stocks_and_cash = _np.asarray(percentages_of_stocks_and_cash, dtype=_np.float64)
+        self.amount_of_stocks = percentages_of_stocks_and_cash[..., :-1] * total_money / prices_of_stocks
+        self.cash = percentages_of_stocks_and_cash[..., -1] * total_money
 
     def total_assets(self, prices_of_stocks):
-        return sum([amount * price for amount, price in zip(self.amount_of_stocks, prices_of_stocks)]) + self.cash
+        return (self.amount_of_stocks * prices_of_stocks).sum(axis=-1) + self.cash
 
     def trade_to_new_percentages(self, percentages_of_stocks_and_cash, prices_of_stocks, trading_fees):
-        total_money = self.total_assets(prices_of_stocks)
-        for idx, (percentage, price) in enumerate(zip(percentages_of_stocks_and_cash[:-1], prices_of_stocks)):
-            stock_trade = (percentage * total_money / price) - \
-                self.amount_of_stocks[idx]
-            if stock_trade > 0:
-                stock_trade = stock_trade / \
-                    (1 - trading_fees + trading_fees * percentage)
-                cash_trade = - stock_trade * price
-                self.amount_of_stocks[idx] = self.amount_of_stocks[idx] + \
-                    stock_trade * (1 - trading_fees)
-                self.cash = self.cash + cash_trade
-            else:
-                stock_trade = stock_trade / (1 - trading_fees * percentage)
-                cash_trade = - stock_trade * price
-                self.amount_of_stocks[idx] = self.amount_of_stocks[idx] + stock_trade
-                self.cash = self.cash + cash_trade * (1 - trading_fees)
+        self.amount_of_stocks, self.cash = rebalance(
+            self.amount_of_stocks,
+            self.cash,
+            _np.asarray(percentages_of_stocks_and_cash, dtype=_np.float64),
+            prices_of_stocks,
+            trading_fees
+        )
 
 
 class MultiStockTradingEnv(_gym.Env):
     """This class is a custom environment for multi stock trading. This is different from the `MultiDatasetTradingEnv` environment in gym-trading-env, as it allows to trade multiple stocks at the same time.   
+
+    Observations are read-only views into the environment's feature array. Set `copy_obs` to get a fresh copy
+    instead, e.g. when the consumer modifies observations in place.
+
+    Instead of `dfs`, the environment can be given preprocessed `market_data`, either a `MarketData` or the name
+    it was published under with `publish_market_data`. Attaching by name lets worker processes share a single
+    copy of the data.
     """
 
     metadata = {'render_modes': ['logs']}
 
     def __init__(self,
-                dfs : list,
+                dfs : list = None,
                 windows = None,
                 trading_fees = 0,
                 portfolio_initial_value = 1000,
@@ -66,21 +101,31 @@ class MultiStockTradingEnv(_gym.Env):
                 strategy = 'maximum_reward',
                 verbose = 1,
                 name = "Stock",
-                render_mode= "logs"
+                render_mode= "logs",
+                copy_obs = False,
+                market_data : MarketData | str = None
                 ):
         self.max_episode_duration = max_episode_duration
         self.verbose = verbose
         self.name = name
         self.render_mode = render_mode
+        self.copy_obs = copy_obs
 
         self.windows = windows
         self.trading_fees = trading_fees
         self.portfolio_initial_value = float(portfolio_initial_value)
         self.strategy = strategy
         
-        self._set_dfs(dfs)
+        if (dfs is None) == (market_data is None):
+            raise ValueError("Please provide either dfs or market_data.")
+        if dfs is not None:
+            self._set_dfs(dfs)
+        else:
+            self.dfs = None
+            self._set_market_data(
+                attach_market_data(market_data) if isinstance(market_data, str) else market_data)
 
-        self.number_of_stocks = len(dfs)
+        self.number_of_stocks = self._number_of_stocks
         self.action_space = spaces.Discrete(self.number_of_stocks + 1)
         self.observation_space = spaces.Box(
             -_np.inf,
@@ -97,58 +142,54 @@ class MultiStockTradingEnv(_gym.Env):
         self.log_metrics = []
 
     def _set_dfs(self, dfs: list[_pd.DataFrame]):
-        dfs = [df.copy() for df in dfs]
         self.dfs = dfs
-        self._number_of_stocks = len(dfs)
-        merged_df = self._dfs_preprocess(dfs)
-        self.length_of_merged_df = len(merged_df)
+        self._set_market_data(MarketData.from_dfs(dfs))
 
-        self._features_columns = [
-            col for col in merged_df.columns if "feature" in col]
-        self._nb_features = len(self._features_columns)
+    def _set_market_data(self, market_data: MarketData):
+        self._number_of_stocks = market_data.number_of_stocks
+        self.length_of_merged_df = len(market_data)
 
-        self._obs_array = _np.array(merged_df[self._features_columns], dtype= _np.float32)
-        self._price_array = [merged_df[f"close_{idx}"] for idx in range(self._number_of_stocks)]
-        self._date_array = merged_df["unix_0"]
+        self._features_columns = market_data.feature_columns
+        self._nb_features = len(self._features_columns)
 
-    def _dfs_preprocess(self, dfs: list[_pd.DataFrame]):
-        dfs = [df.copy() for df in dfs]
-        dfs = [_scdata.data_preprocess(df, dropna=False) for df in dfs]
-        for idx, df in enumerate(dfs):
-            df.columns += f"_{idx}"
-        merged_df = _pd.concat(dfs, axis=1)
-        merged_df.dropna(inplace=True)
-        return merged_df
+        self._obs_array = market_data.obs.view()
+        self._obs_array.flags.writeable = False
+        self._obs_windows = None
+        if self.windows is not None:
+            # (T - windows + 1, windows, features) view over _obs_array, no data is copied
+            self._obs_windows = _np.lib.stride_tricks.sliding_window_view(
+                self._obs_array, self.windows, axis=0).transpose(0, 2, 1)
+        self._price_array = market_data.price
+        self._date_array = market_data.date
 
     def get_dfs_length(self):
         return self.length_of_merged_df
     
     def _get_price(self, delta = 0):
-        return [price.iloc[self._idx + delta] for price in self._price_array]
+        return self._price_array[self._idx + delta]
     
     def _get_obs(self):
 
         if self.windows is None:
-            _step_index = self._idx
+            obs = self._obs_array[self._idx]
         else:
-            _step_index = _np.arange(
-                self._idx + 1 - self.windows, self._idx + 1)
-        return self._obs_array[_step_index]
+            obs = self._obs_windows[self._idx + 1 - self.windows]
+        return obs.copy() if self.copy_obs else obs
 
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
 
         self._step = 0
-        self._percentages_of_stocks_and_cash = [
-            0] * self.number_of_stocks + [1]  # 1 for cash
+        self._percentages_of_stocks_and_cash = _np.zeros(self.number_of_stocks + 1)
+        self._percentages_of_stocks_and_cash[-1] = 1  # 1 for cash
 
         self._idx = 0
         if self.windows is not None:
             self._idx = self.windows - 1
         if self.max_episode_duration != 'max':
-            self._idx = _np.random.randint(
+            self._idx = self.np_random.integers(
                 low=self._idx,
-                high=len(self.df) - self.max_episode_duration - self._idx
+                high=self.length_of_merged_df - self.max_episode_duration - self._idx
             )
 
         self._portfolio = Portfolio(
@@ -173,14 +214,14 @@ class MultiStockTradingEnv(_gym.Env):
 
     def _take_action(self, actions: int):
         if (self.strategy == 'maximum_reward'):
-            actions_one_hot: list[int] = [0] * self.action_space.n
-            actions_one_hot[actions] = 1
-            percentages_of_stocks_and_cash = list(actions_one_hot)
+            percentages_of_stocks_and_cash = _np.zeros(self.action_space.n)
+            percentages_of_stocks_and_cash[actions] = 1
         elif (self.strategy == 'buy_and_hold'):
-            percentages_of_stocks_and_cash = actions
+            percentages_of_stocks_and_cash = _np.asarray(actions, dtype=_np.float64)
         elif (self.strategy == 'percentage'):
-            percentages_of_stocks_and_cash = [i/sum(actions) for i in actions]
-        if percentages_of_stocks_and_cash != self._percentages_of_stocks_and_cash:
+            percentages_of_stocks_and_cash = _np.asarray(actions, dtype=_np.float64)
+            percentages_of_stocks_and_cash = percentages_of_stocks_and_cash / percentages_of_stocks_and_cash.sum()
+        if not _np.array_equal(percentages_of_stocks_and_cash, self._percentages_of_stocks_and_cash):
             self._trade(percentages_of_stocks_and_cash)
 
     def reward_function(self):
@@ -236,5 +277,28 @@ class MultiStockTradingEnv(_gym.Env):
     def get_history_reward(self):
         return self.historical_info.get_history_reward()
 
+    def get_observations(self):
+        """Observations of a full episode, in order, as one read-only array.
+
+        Observations only hold market features, so they do not depend on the actions taken: a policy can be
+        evaluated on all of them at once, and its actions replayed afterwards. The array has shape
+        ``(T - windows + 1, windows, features)``, or ``(T, features)`` without windows, and is a view of the
+        environment's data.
+        """
+        return self._obs_array if self.windows is None else self._obs_windows
+
+    def get_feature_columns(self):
+        """Name of each feature of an observation"""
+        return list(self._features_columns)
+
+    def get_prices(self):
+        """Close prices of shape ``(T, n_stocks)``, as read-only view"""
+        prices = self._price_array.view()
+        prices.flags.writeable = False
+        return prices
+
     def get_date(self):
-        return self._date_array
\ No newline at end of file
+        return _pd.Series(
+            self._date_array,
+            index=_pd.DatetimeIndex(_pd.to_datetime(self._date_array, unit="ms"), name="date"),
+            name="unix_0")
\ No newline at end of file
@@ -0,0 +1,166 @@
+from dataclasses import dataclass
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+
+import numpy as _np
+import pandas as _pd
+
+import stockcore.data as _scdata
+
+
+__all__ = [
+    'MarketData',
+    'publish_market_data',
+    'attach_market_data',
+    'release_market_data',
+]
+
+SHARED_DIR = Path("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "stocksense")
+"""Where published market data lives. On Linux this is backed by shared memory."""
+
+
+@dataclass
+class MarketData:
+    """Preprocessed arrays backing a `MultiStockTradingEnv`.
+
+    Attributes
+    ----------
+    obs : np.ndarray
+        Feature matrix of shape ``(T, features)``, float32
+    price : np.ndarray
+        Close prices of shape ``(T, n_stocks)``, float64
+    date : np.ndarray
+        Unix timestamps in milliseconds of shape ``(T,)``, int64
+    feature_columns : list[str]
+        Name of each column of `obs`
+    """
+    obs: _np.ndarray
+    price: _np.ndarray
+    date: _np.ndarray
+    feature_columns: list[str]
+
+    @property
+    def number_of_stocks(self) -> int:
+        return self.price.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.date)
+
+    @staticmethod
+    def from_dfs(dfs: list[_pd.DataFrame]) -> "MarketData":
+        """Preprocess and merge K-line data of several stocks on their common dates.
+
+        Parameters
+        ----------
+        dfs : list[pd.DataFrame]
+            K-line data of each stock, as returned by the data endpoints
+
+        Returns
+        -------
+        MarketData
+            The merged market data
+        """
+        dfs = [_scdata.data_preprocess(df, dropna=False, inplace=False) for df in dfs]
+        for idx, df in enumerate(dfs):
+            df.columns += f"_{idx}"
+        merged_df = _pd.concat(dfs, axis=1)
+        merged_df.dropna(inplace=True)
+
+        feature_columns = [col for col in merged_df.columns if "feature" in col]
+        return MarketData(
+            obs=_np.ascontiguousarray(merged_df[feature_columns], dtype=_np.float32),
+            price=_np.ascontiguousarray(
+                merged_df[[f"close_{idx}" for idx in range(len(dfs))]], dtype=_np.float64),
+            date=_np.ascontiguousarray(merged_df["unix_0"], dtype=_np.int64),
+            feature_columns=feature_columns
+        )
+
+    def save(self, path: str | Path) -> None:
+        """Save the arrays as ``.npy`` files in directory `path`.
+
+        The directory is written next to its final location and then renamed,
+        so readers never observe a partially written dataset.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(tempfile.mkdtemp(prefix=f".{path.name}-", dir=path.parent))
+        try:
+            _np.save(tmp_path / "obs.npy", self.obs)
+            _np.save(tmp_path / "price.npy", self.price)
+            _np.save(tmp_path / "date.npy", self.date)
+            with open(tmp_path / "meta.json", "w") as file:
+                json.dump({"feature_columns": self.feature_columns}, file)
+            if path.exists():
+                shutil.rmtree(path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def load(path: str | Path, mmap: bool = True) -> "MarketData":
+        """Load market data saved with :meth:`save`.
+
+        Parameters
+        ----------
+        path : str | Path
+            Directory the data was saved to
+        mmap : bool, optional
+            Whether to memory-map the arrays read-only instead of reading them into memory, by default True
+
+        Returns
+        -------
+        MarketData
+            The loaded market data
+        """
+        path = Path(path)
+        mmap_mode = "r" if mmap else None
+        with open(path / "meta.json", "r") as file:
+            meta = json.load(file)
+        return MarketData(
+            obs=_np.load(path / "obs.npy", mmap_mode=mmap_mode),
+            price=_np.load(path / "price.npy", mmap_mode=mmap_mode),
+            date=_np.load(path / "date.npy", mmap_mode=mmap_mode),
+            feature_columns=meta["feature_columns"]
+        )
+
+
+def publish_market_data(data: MarketData, name: str, root: str | Path = SHARED_DIR) -> Path:
+    """Publish market data under `name` so other processes can attach to it without copying.
+
+    Parameters
+    ----------
+    data : MarketData
+        The market data to publish
+    name : str
+        Name to publish the data under
+    root : str | Path, optional
+        Directory holding published data, by default :data:`SHARED_DIR`
+
+    Returns
+    -------
+    Path
+        Where the data was published
+    """
+    path = Path(root, name)
+    data.save(path)
+    return path
+
+
+def attach_market_data(name: str, root: str | Path = SHARED_DIR) -> MarketData:
+    """Attach to market data published with :func:`publish_market_data`.
+
+    The arrays are read-only memory maps, so every attached process shares the same physical pages.
+    """
+    return MarketData.load(Path(root, name), mmap=True)
+
+
+def release_market_data(name: str, root: str | Path = SHARED_DIR) -> None:
+    """Remove market data published with :func:`publish_market_data`.
+
+    Processes still attached keep their mappings until they exit.
+    """
+    shutil.rmtree(Path(root, name), ignore_errors=True)
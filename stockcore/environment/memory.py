@@ -1,16 +1,27 @@
 import random
 from collections import namedtuple, deque
 
+import numpy as _np
+import torch as _torch
+
 
 __all__ = [
     'ReplayMemory',
+    'ArrayReplayMemory',
+    'PrioritizedReplayMemory',
     'Transition',
+    'TransitionBatch',
+    'PrioritizedTransitionBatch',
 ]
 
 Transition = namedtuple(
     'Transition',
     ('state', 'action', 'next_state', 'reward'))
 
+TransitionBatch = namedtuple(
+    'TransitionBatch',
+    ('state', 'action', 'next_state', 'reward', 'done'))
+
 
 class ReplayMemory(object):
     def __init__(self, capacity: int) -> None:
@@ -25,3 +36,278 @@ class ReplayMemory(object):
 
     def __len__(self) -> int:
         return len(self.memory)
+
+
+def _to_numpy(value):
+    if isinstance(value, _torch.Tensor):
+        return value.detach().cpu().numpy()
+    return value
+
+
+class ArrayReplayMemory(object):
+    """Replay memory backed by preallocated arrays used as a circular buffer.
+
+    Drop-in for `ReplayMemory`: :meth:`push` takes the same transitions, but :meth:`sample` returns them
+    already stacked, as a `TransitionBatch` of contiguous arrays (or tensors). A terminal transition is
+    pushed with ``next_state=None``; its next state is then zeros and its ``done`` flag is set.
+
+    Arrays are allocated on the first push, with the shapes and dtypes of that transition. Pushing and
+    sampling are O(1) and O(batch_size) whatever the capacity.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of transitions kept, the oldest ones are overwritten first
+    device : torch.device | str, optional
+        If given, batches are returned as tensors on this device instead of arrays, by default None
+    pin_memory : bool, optional
+        Whether to stage batches in pinned memory so the copy to a CUDA device is asynchronous, by default
+        False. Ignored when CUDA is unavailable.
+    seed : int, optional
+        Seed of the sampling, by default None
+    """
+
+    def __init__(self, capacity: int, device: _torch.device | str = None, pin_memory: bool = False, seed: int = None) -> None:
+        self.capacity = capacity
+        self.device = None if device is None else _torch.device(device)
+        self.pin_memory = pin_memory and _torch.cuda.is_available()
+        self._rng = _np.random.default_rng(seed)
+        self._state: _np.ndarray = None
+        self._position = 0
+        self._size = 0
+
+    def _allocate(self, state, action, reward) -> None:
+        state, action, reward = _np.asarray(state), _np.asarray(action), _np.asarray(reward)
+        self._state = _np.zeros((self.capacity, *state.shape), dtype=state.dtype)
+        self._action = _np.zeros((self.capacity, *action.shape), dtype=action.dtype)
+        self._next_state = _np.zeros((self.capacity, *state.shape), dtype=state.dtype)
+        self._reward = _np.zeros((self.capacity, *reward.shape), dtype=reward.dtype)
+        self._done = _np.zeros(self.capacity, dtype=_np.bool_)
+
+    def _arrays(self) -> tuple[_np.ndarray, ...]:
+        """The backing arrays, in the order of the fields of `TransitionBatch`"""
+        return self._state, self._action, self._next_state, self._reward, self._done
+
+    def push(self, state, action, next_state, reward) -> None:
+        """Save a transition"""
+        state, action, reward = _to_numpy(state), _to_numpy(action), _to_numpy(reward)
+        if self._state is None:
+            self._allocate(state, action, reward)
+
+        idx = self._position
+        self._state[idx] = state
+        self._action[idx] = action
+        self._reward[idx] = reward
+        if next_state is None:
+            self._next_state[idx] = 0
+            self._done[idx] = True
+        else:
+            self._next_state[idx] = _to_numpy(next_state)
+            self._done[idx] = False
+
+        self._position = idx + 1 if idx + 1 < self.capacity else 0
+        if self._size < self.capacity:
+            self._size += 1
+
+    def extend(self, states, actions, next_states, rewards, dones) -> None:
+        """Save a batch of transitions, e.g. one step of a vectorized environment.
+
+        The first dimension of every argument indexes the transitions. Next states of terminal transitions
+        are stored as given, and flagged by `dones`.
+        """
+        batch = [_np.asarray(_to_numpy(values)) for values in (states, actions, next_states, rewards, dones)]
+        if self._state is None:
+            self._allocate(batch[0][0], batch[1][0], batch[3][0])
+
+        n = len(batch[0])
+        if n > self.capacity:  # only the last `capacity` transitions would survive
+            batch = [values[-self.capacity:] for values in batch]
+            self._position = (self._position + n - self.capacity) % self.capacity
+            n = self.capacity
+        idx = (self._position + _np.arange(n)) % self.capacity
+        for array, values in zip(self._arrays(), batch):
+            array[idx] = values
+
+        self._position = (self._position + n) % self.capacity
+        self._size = min(self._size + n, self.capacity)
+
+    def _to_device(self, array: _np.ndarray) -> _torch.Tensor:
+        tensor = _torch.from_numpy(array)
+        if self.pin_memory:
+            tensor = tensor.pin_memory()
+        return tensor.to(self.device, non_blocking=self.pin_memory)
+
+    def sample(self, batch_size: int) -> TransitionBatch:
+        """Sample `batch_size` distinct transitions uniformly.
+
+        Returns
+        -------
+        TransitionBatch
+            The transitions stacked along a first dimension of size `batch_size`, as arrays,
+            or as tensors on `device` if one was given
+        """
+        if batch_size > self._size:
+            raise ValueError("Sample larger than population")
+        idx = self._rng.choice(self._size, batch_size, replace=False)
+        batch = [array.take(idx, axis=0) for array in self._arrays()]
+        if self.device is not None:
+            batch = [self._to_device(array) for array in batch]
+        return TransitionBatch(*batch)
+
+    def __len__(self) -> int:
+        return self._size
+
+
+PrioritizedTransitionBatch = namedtuple(
+    'PrioritizedTransitionBatch',
+    TransitionBatch._fields + ('weight', 'index'))
+
+
+class PrioritizedReplayMemory(ArrayReplayMemory):
+    """Prioritized experience replay (Schaul et al., 2016) on top of `ArrayReplayMemory`.
+
+    Transition ``i`` is sampled with probability ``p_i^alpha / sum_j p_j^alpha``. Priorities live in two
+    array-based segment trees, a sum-tree to sample and a min-tree to normalize the importance-sampling
+    weights, each stored as one flat array. Sampling and priority updates walk the trees one level at a
+    time for the whole batch, so both cost O(batch_size log capacity) in a few NumPy calls.
+
+    New transitions get the largest priority seen so far, so each is replayed at least once with high
+    probability. After a training step, pass the TD errors of the batch to :meth:`update_priorities`.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of transitions kept, the oldest ones are overwritten first
+    alpha : float, optional
+        How much prioritization is used, 0 being uniform sampling, by default 0.6
+    beta : float, optional
+        Exponent of the importance-sampling weights, 1 fully compensating the non-uniform sampling,
+        by default 0.4. Usually annealed to 1 over training by setting the attribute.
+    epsilon : float, optional
+        Added to the absolute TD errors so no transition gets a zero priority, by default 1e-6
+    device : torch.device | str, optional
+        If given, batches are returned as tensors on this device instead of arrays, by default None
+    pin_memory : bool, optional
+        Whether to stage batches in pinned memory, by default False
+    seed : int, optional
+        Seed of the sampling, by default None
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        alpha: float = 0.6,
+        beta: float = 0.4,
+        epsilon: float = 1e-6,
+        device: _torch.device | str = None,
+        pin_memory: bool = False,
+        seed: int = None
+    ) -> None:
+        super().__init__(capacity, device, pin_memory, seed)
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self._max_priority = 1.0
+
+        # node i has children 2i and 2i+1, the leaves start at _leaves, node 0 is unused
+        self._depth = max(1, (capacity - 1).bit_length())
+        self._leaves = 1 << self._depth
+        self._shifts = _np.arange(self._depth + 1)
+        self._sum_tree = _np.zeros(2 * self._leaves)
+        self._min_tree = _np.full(2 * self._leaves, _np.inf)
+
+    def _set_priority(self, idx: int, priority: float) -> None:
+        """Set the priority (already raised to alpha) of one transition, and recompute its ancestors"""
+        path = (idx + self._leaves) >> self._shifts  # from the leaf up to the root
+        siblings = path[:-1] ^ 1
+        # each ancestor sums (or mins) the new leaf with the siblings met on the way up
+        self._sum_tree[path] = _np.cumsum(_np.concatenate(([priority], self._sum_tree[siblings])))
+        self._min_tree[path] = _np.minimum.accumulate(_np.concatenate(([priority], self._min_tree[siblings])))
+
+    def _set_priorities(self, indices: _np.ndarray, priorities: _np.ndarray) -> None:
+        """Set the priorities (already raised to alpha) of distinct transitions, and update their ancestors"""
+        indices = _np.asarray(indices)
+        order = _np.argsort(indices)
+        nodes = indices[order] + self._leaves
+        self._sum_tree[nodes] = _np.broadcast_to(priorities, nodes.shape)[order]
+        self._min_tree[nodes] = self._sum_tree[nodes]
+        for _ in range(self._depth):
+            # nodes stay sorted, so the shared parents are adjacent
+            nodes >>= 1
+            if len(nodes) > 1:
+                nodes = nodes[_np.concatenate(([True], nodes[1:] != nodes[:-1]))]
+            self._sum_tree[nodes] = self._sum_tree[2 * nodes] + self._sum_tree[2 * nodes + 1]
+            self._min_tree[nodes] = _np.minimum(self._min_tree[2 * nodes], self._min_tree[2 * nodes + 1])
+
+    def push(self, state, action, next_state, reward) -> None:
+        """Save a transition, with the largest priority so far"""
+        idx = self._position
+        super().push(state, action, next_state, reward)
+        self._set_priority(idx, self._max_priority ** self.alpha)
+
+    def extend(self, states, actions, next_states, rewards, dones) -> None:
+        """Save a batch of transitions, with the largest priority so far"""
+        n = min(len(states), self.capacity)
+        idx = (self._position + len(states) - n + _np.arange(n)) % self.capacity
+        super().extend(states, actions, next_states, rewards, dones)
+        self._set_priorities(idx, self._max_priority ** self.alpha)
+
+    def _find(self, targets: _np.ndarray) -> _np.ndarray:
+        """Index of the transition whose cumulative priority range holds each target"""
+        nodes = _np.ones(len(targets), dtype=_np.int64)
+        for _ in range(self._depth):
+            left = self._sum_tree[2 * nodes]
+            right = targets > left
+            targets = targets - left * right
+            nodes = 2 * nodes + right
+        # rounding may step past the last transition
+        return _np.minimum(nodes - self._leaves, self._size - 1)
+
+    def sample(self, batch_size: int, beta: float = None) -> PrioritizedTransitionBatch:
+        """Sample `batch_size` transitions by priority, one from each of `batch_size` equal priority strata.
+
+        Parameters
+        ----------
+        batch_size : int
+            Number of transitions to sample
+        beta : float, optional
+            Exponent of the importance-sampling weights, by default the `beta` attribute
+
+        Returns
+        -------
+        PrioritizedTransitionBatch
+            The transitions as in `ArrayReplayMemory.sample`, plus their importance-sampling ``weight``,
+            normalized so the largest possible weight is 1, and their ``index`` for :meth:`update_priorities`
+        """
+        if batch_size > self._size:
+            raise ValueError("Sample larger than population")
+        beta = self.beta if beta is None else beta
+
+        total = self._sum_tree[1]
+        targets = (_np.arange(batch_size) + self._rng.random(batch_size)) * (total / batch_size)
+        idx = self._find(targets)
+
+        probabilities = self._sum_tree[idx + self._leaves] / total
+        min_probability = self._min_tree[1] / total
+        weights = ((probabilities / min_probability) ** -beta).astype(_np.float32)
+
+        batch = [array.take(idx, axis=0) for array in self._arrays()] + [weights]
+        if self.device is not None:
+            batch = [self._to_device(array) for array in batch]
+        return PrioritizedTransitionBatch(*batch, idx)
+
+    def update_priorities(self, indices, td_errors) -> None:
+        """Set the priorities of sampled transitions from their new TD errors.
+
+        Parameters
+        ----------
+        indices : np.ndarray
+            The ``index`` of a sampled batch
+        td_errors : np.ndarray | torch.Tensor
+            TD error of each transition
+        """
+        priorities = _np.abs(_np.asarray(_to_numpy(td_errors), dtype=_np.float64)).reshape(-1) + self.epsilon
+        self._max_priority = max(self._max_priority, float(priorities.max()))
+        # a transition sampled twice keeps its last error, as if updated one after the other
+        indices, last = _np.unique(_np.asarray(indices)[::-1], return_index=True)
+        self._set_priorities(indices, priorities[::-1][last] ** self.alpha)
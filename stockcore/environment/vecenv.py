@@ -0,0 +1,166 @@
+from typing import Any, Optional, Sequence
+
+import gymnasium as _gym
+import numpy as _np
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv, VecEnvIndices, VecEnvObs, VecEnvStepReturn
+
+from .customenv import MultiStockTradingEnv, rebalance
+
+
+__all__ = ['VecMultiStockTradingEnv']
+
+
+class VecMultiStockTradingEnv(VecEnv):
+    """Run `n_envs` independent `MultiStockTradingEnv` episodes in lockstep.
+
+    All episodes read from the observation and price arrays of a single template environment,
+    so the merged market data is held only once no matter how many environments are stepped.
+    Portfolio bookkeeping is done on ``(n_envs, n_stocks)`` arrays, one vectorized step per call.
+
+    Only the ``maximum_reward`` strategy (one discrete action per stock plus cash) is supported.
+
+    Parameters
+    ----------
+    env : MultiStockTradingEnv
+        The template environment providing the market data, fees and initial portfolio value
+    n_envs : int
+        Number of episodes to run in parallel
+    max_episode_duration : int | str, optional
+        Length of each episode, or ``'max'`` to run until the end of the data.
+        Episodes of a fixed length start at random offsets. Defaults to the one of `env`.
+    seed : int | None, optional
+        Seed for the random start offsets, by default None
+    """
+
+    def __init__(
+        self,
+        env: MultiStockTradingEnv,
+        n_envs: int,
+        max_episode_duration: int | str = None,
+        seed: Optional[int] = None
+    ) -> None:
+        if env.strategy != 'maximum_reward':
+            raise ValueError("Only the 'maximum_reward' strategy can be vectorized.")
+        self._env = env
+        self.max_episode_duration = (env.max_episode_duration
+                                     if max_episode_duration is None else max_episode_duration)
+        self._rng = _np.random.default_rng(seed)
+
+        super().__init__(n_envs, env.observation_space, env.action_space)
+
+        self._first_idx = 0 if env.windows is None else env.windows - 1
+
+        self._idx = _np.zeros(n_envs, dtype=_np.int64)
+        self._step = _np.zeros(n_envs, dtype=_np.int64)
+        self._percentages_of_stocks_and_cash = _np.zeros((n_envs, env.number_of_stocks + 1))
+        self._amount_of_stocks = _np.zeros((n_envs, env.number_of_stocks))
+        self._cash = _np.zeros(n_envs)
+        self._total_assets = _np.zeros(n_envs)
+        self._episode_rewards = _np.zeros(n_envs)
+
+        self._actions = None
+
+    def get_dfs_length(self) -> int:
+        return self._env.get_dfs_length()
+
+    def _get_obs(self, indices: _np.ndarray = None) -> _np.ndarray:
+        idx = self._idx if indices is None else self._idx[indices]
+        if self._env.windows is None:
+            return self._env._obs_array[idx]
+        return self._env._obs_windows[idx - self._first_idx]
+
+    def _reset_envs(self, indices: _np.ndarray) -> None:
+        n = len(indices)
+        start = _np.full(n, self._first_idx, dtype=_np.int64)
+        if self.max_episode_duration != 'max':
+            start = self._rng.integers(
+                low=self._first_idx,
+                high=self._env.get_dfs_length() - self.max_episode_duration - self._first_idx,
+                size=n
+            )
+        self._idx[indices] = start
+        self._step[indices] = 0
+        self._percentages_of_stocks_and_cash[indices] = 0
+        self._percentages_of_stocks_and_cash[indices, -1] = 1  # 1 for cash
+        self._amount_of_stocks[indices] = 0
+        self._cash[indices] = self._env.portfolio_initial_value
+        self._total_assets[indices] = self._env.portfolio_initial_value
+        self._episode_rewards[indices] = 0
+
+    def reset(self) -> VecEnvObs:
+        if self._seeds[0] is not None:
+            self._rng = _np.random.default_rng(self._seeds[0])
+        self._reset_seeds()
+        self._reset_options()
+
+        self._reset_envs(_np.arange(self.num_envs))
+        return self._get_obs()
+
+    def step_async(self, actions: _np.ndarray) -> None:
+        self._actions = _np.asarray(actions, dtype=_np.int64).reshape(self.num_envs)
+
+    def step_wait(self) -> VecEnvStepReturn:
+        env = self._env
+
+        targets = _np.zeros_like(self._percentages_of_stocks_and_cash)
+        targets[_np.arange(self.num_envs), self._actions] = 1
+        changed = (targets != self._percentages_of_stocks_and_cash).any(axis=1)
+        if changed.any():
+            self._amount_of_stocks[changed], self._cash[changed] = rebalance(
+                self._amount_of_stocks[changed],
+                self._cash[changed],
+                targets[changed],
+                env._price_array[self._idx[changed]],
+                env.trading_fees
+            )
+            self._percentages_of_stocks_and_cash[changed] = targets[changed]
+
+        self._idx += 1
+        self._step += 1
+
+        total_assets = (self._amount_of_stocks * env._price_array[self._idx]).sum(axis=1) + self._cash
+        with _np.errstate(divide='ignore', invalid='ignore'):
+            rewards = _np.log(total_assets / self._total_assets)
+        self._total_assets = total_assets
+        self._episode_rewards += rewards
+
+        terminated = total_assets <= 0
+        truncated = self._idx >= env.get_dfs_length() - 1
+        if isinstance(self.max_episode_duration, int):
+            truncated |= self._step >= self.max_episode_duration - 1
+        dones = terminated | truncated
+
+        observations = self._get_obs()
+        infos = [{} for _ in range(self.num_envs)]
+        done_indices = _np.flatnonzero(dones)
+        for i in done_indices:
+            infos[i]["terminal_observation"] = observations[i].copy()
+            infos[i]["TimeLimit.truncated"] = bool(truncated[i] and not terminated[i])
+            infos[i]["episode"] = {"r": self._episode_rewards[i], "l": int(self._step[i])}
+        if len(done_indices) > 0:
+            self._reset_envs(done_indices)
+            observations[done_indices] = self._get_obs(done_indices)
+
+        return observations, rewards.astype(_np.float32), dones, infos
+
+    def close(self) -> None:
+        self._env.close()
+
+    def seed(self, seed: Optional[int] = None) -> Sequence[None | int]:
+        seeds = super().seed(seed)
+        self._rng = _np.random.default_rng(seeds[0])
+        self._reset_seeds()
+        return seeds
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> list[Any]:
+        return [getattr(self._env, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None) -> None:
+        setattr(self._env, attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> list[Any]:
+        return [getattr(self._env, method_name)(*method_args, **method_kwargs)
+                for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class: type[_gym.Wrapper], indices: VecEnvIndices = None) -> list[bool]:
+        return [False for _ in self._get_indices(indices)]
@@ -1,2 +1,2 @@
 from .naive import NaiveDQN
-from .models import build_model
\ No newline at end of file
+from .models import build_model, predict_batched
\ No newline at end of file
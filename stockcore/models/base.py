@@ -23,22 +23,28 @@ class DQNBase(_nn.Module, ABC):
         raise NotImplementedError
     
     def act(self, x: _torch.Tensor, epsilon: float = 0.0) -> _torch.Tensor:
-        """Select an action based on the epsilon-greedy policy.
+        """Select actions for a batch of states based on the epsilon-greedy policy.
+
+        All states go through a single forward pass, and each row explores independently, with the random
+        draws made on the device of `x` so no value is synchronized to the host.
 
         Parameters
         ----------
         x : _torch.Tensor
-            The input state.
+            The input states, of shape ``(N, n_observations)``.
         epsilon : float, optional
-            The probability of selecting a random action. If epsilon is 0 (by default), the greedy policy is used.
+            The probability of selecting a random action, for each state. If epsilon is 0 (by default),
+            the greedy policy is used.
 
         Returns
         -------
         _torch.Tensor
-            A tensor containing a single value, representing the selected action.
+            A tensor of shape ``(N, 1)`` containing the selected action of each state.
         """
-        if _torch.rand(1).item() < epsilon:
-            return _torch.randint(self.n_actions, (1,1))
-        else:
-            with _torch.no_grad():
-                return self.forward(x).max(1).indices.view(1, 1)
+        with _torch.inference_mode():
+            actions = self.forward(x).argmax(dim=1)
+            if epsilon > 0:
+                explore = _torch.rand(actions.shape, device=actions.device) < epsilon
+                random_actions = _torch.randint(self.n_actions, actions.shape, device=actions.device)
+                actions = _torch.where(explore, random_actions, actions)
+        return actions.view(-1, 1)
@@ -1,11 +1,13 @@
+import numpy as _np
+import torch as _torch
 from stable_baselines3 import A2C, DQN
 from stable_baselines3.common import base_class as _base
 
-from ..environment import MultiStockTradingEnv
+from ..environment import MultiStockTradingEnv, VecMultiStockTradingEnv
 from ..parameters import ModelParameters
 
 
-def build_model(params: ModelParameters, env: MultiStockTradingEnv) -> _base.BaseAlgorithm:
+def build_model(params: ModelParameters, env: MultiStockTradingEnv | VecMultiStockTradingEnv) -> _base.BaseAlgorithm:
     if params.model == "A2C":
         return _build_model_a2c(params, env)
     elif params.model == "DQN":
@@ -14,7 +16,7 @@ def build_model(params: ModelParameters, env: MultiStockTradingEnv) -> _base.Bas
         raise ValueError(f"Model {params.model} not supported.")
 
 
-def _build_model_a2c(params: ModelParameters, env: MultiStockTradingEnv) -> A2C:
+def _build_model_a2c(params: ModelParameters, env: MultiStockTradingEnv | VecMultiStockTradingEnv) -> A2C:
     return A2C(
         'MlpPolicy', env,
         learning_rate=params.learning_rate,
@@ -24,7 +26,7 @@ def _build_model_a2c(params: ModelParameters, env: MultiStockTradingEnv) -> A2C:
         **params.params
     )
 
-def _build_model_dqn(params: ModelParameters, env: MultiStockTradingEnv) -> DQN:
+def _build_model_dqn(params: ModelParameters, env: MultiStockTradingEnv | VecMultiStockTradingEnv) -> DQN:
     return DQN(
         'MlpPolicy', env,
         learning_rate=params.learning_rate,
@@ -33,4 +35,45 @@ def _build_model_dqn(params: ModelParameters, env: MultiStockTradingEnv) -> DQN:
         **params.params
     )
 
+def predict_batched(
+    model: _base.BaseAlgorithm,
+    observations: _np.ndarray,
+    batch_size: int = 4096,
+    deterministic: bool = False
+) -> _np.ndarray:
+    """Predict the actions for many observations with a few large forward passes.
+
+    Equivalent to calling ``model.predict`` on each observation in turn, which is valid as long as the
+    observations do not depend on the actions taken, as with `MultiStockTradingEnv.get_observations`.
+
+    Parameters
+    ----------
+    model : BaseAlgorithm
+        The trained model
+    observations : np.ndarray
+        Observations of shape ``(N, *observation_space.shape)``
+    batch_size : int, optional
+        Number of observations per forward pass, by default 4096
+    deterministic : bool, optional
+        Whether to use deterministic actions, by default False as in ``model.predict``
+
+    Returns
+    -------
+    np.ndarray
+        The action for each observation, shape ``(N,)``
+    """
+    model.policy.set_training_mode(False)
+    actions = []
+    with _torch.inference_mode():
+        for start in range(0, len(observations), batch_size):
+            batch = _np.asarray(observations[start:start + batch_size])
+            actions.append(model.policy.predict(batch, deterministic=deterministic)[0])
+    actions = _np.concatenate(actions) if actions else _np.empty(0, dtype=_np.int64)
+
+    if isinstance(model, DQN) and not deterministic:
+        # DQN.predict explores per call, which here means per observation rather than per batch
+        explore = _np.random.rand(len(actions)) < model.exploration_rate
+        actions[explore] = _np.random.randint(model.action_space.n, size=explore.sum())
+    return actions
+
 # TODO: Implement more models
\ No newline at end of file
@@ -42,6 +42,8 @@ class EnvironmentParameters:
     initial_amount: float = 1000
     trading_fee: float = 0.0001
     windows: int = 10
+    n_envs: int = 1
+    episode_duration: int | None = None  # of the n_envs training episodes, by default the train set split in n_envs
     verbose: int = 0
     val_freq: int = 10000
     n_val_episodes: int = 1
@@ -0,0 +1,184 @@
+import copy
+import json
+from pathlib import Path
+import warnings
+
+import numpy as _np
+import torch as _torch
+import torch.nn as _nn
+
+
+__all__ = [
+    'ExportedPolicy',
+    'export_policy',
+    'load_policy',
+]
+
+FORMAT_VERSION = 1
+MODULE_FILE = "policy.pt"
+SPEC_FILE = "spec.json"
+
+
+class _PolicyScores(_nn.Module):
+    """Action scores of a stable-baselines3 policy: Q-values for DQN, action logits for actor-critics.
+
+    Holds only the modules needed for inference, not the optimizer or the value network.
+    """
+
+    def __init__(self, policy: _nn.Module) -> None:
+        super().__init__()
+        if hasattr(policy, "q_net"):
+            self.features_extractor = policy.q_net.features_extractor
+            self.latent = None
+            self.head = policy.q_net.q_net
+        else:
+            self.features_extractor = policy.pi_features_extractor
+            self.latent = policy.mlp_extractor
+            self.head = policy.action_net
+
+    def forward(self, obs: _torch.Tensor) -> _torch.Tensor:
+        features = self.features_extractor(obs.float())
+        if self.latent is not None:
+            features = self.latent.forward_actor(features)
+        return self.head(features)
+
+
+def export_policy(model, path: str | Path, feature_columns: list[str] = None) -> Path:
+    """Export the greedy policy of a trained model, without the rest of the algorithm.
+
+    The network mapping observations to action scores is traced to TorchScript, frozen, and saved
+    with a JSON spec of its inputs and outputs. :func:`load_policy` loads it back without
+    stable-baselines3, in milliseconds.
+
+    Parameters
+    ----------
+    model : BaseAlgorithm
+        A trained stable-baselines3 model with a discrete action space, e.g. DQN or A2C
+    path : str | Path
+        Directory to export the policy to
+    feature_columns : list[str], optional
+        Name of each feature of an observation, recorded in the spec
+
+    Returns
+    -------
+    Path
+        The directory the policy was exported to
+    """
+    if not hasattr(model.action_space, "n"):
+        raise ValueError("Only policies over a discrete action space can be exported.")
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    shape = tuple(model.observation_space.shape)
+
+    # trace a CPU copy, so the model keeps its device and the artifact holds no device constants
+    scores = copy.deepcopy(_PolicyScores(model.policy)).cpu().eval()
+    with _torch.no_grad(), warnings.catch_warnings():
+        # recent torch releases deprecate TorchScript, but a traced module keeps a dynamic batch size
+        # and loads with torch.jit.load alone
+        warnings.simplefilter("ignore", _torch.jit.TracerWarning)
+        warnings.simplefilter("ignore", FutureWarning)
+        module = _torch.jit.freeze(_torch.jit.trace(scores, _torch.zeros((1, *shape))))
+        _torch.jit.save(module, path / MODULE_FILE)
+
+    with open(path / SPEC_FILE, "w") as file:
+        json.dump({
+            "format": "torchscript",
+            "version": FORMAT_VERSION,
+            "algorithm": type(model).__name__,
+            "observation_shape": list(shape),
+            "observation_dtype": "float32",
+            "windows": shape[0] if len(shape) == 2 else None,
+            "feature_columns": feature_columns,
+            "n_actions": int(model.action_space.n),
+        }, file, indent=4)
+    return path
+
+
+def _as_array(observations) -> _np.ndarray:
+    observations = _np.asarray(observations, dtype=_np.float32)
+    # torch refuses to share memory with read-only arrays, such as env.get_observations() views
+    return observations if observations.flags.writeable else observations.copy()
+
+
+class ExportedPolicy:
+    """Greedy policy exported with :func:`export_policy`, see :func:`load_policy`.
+
+    Calls are thread-safe, so a single instance can serve concurrent requests.
+
+    Attributes
+    ----------
+    spec : dict
+        The spec saved with the policy
+    """
+
+    def __init__(self, module: _torch.jit.ScriptModule, spec: dict, device: _torch.device) -> None:
+        self._module = module
+        self.spec = spec
+        self.device = device
+
+    @property
+    def observation_shape(self) -> tuple[int, ...]:
+        return tuple(self.spec["observation_shape"])
+
+    @property
+    def n_actions(self) -> int:
+        return self.spec["n_actions"]
+
+    def scores(self, observations: _np.ndarray) -> _np.ndarray:
+        """Action scores of a batch of observations, shape ``(N, n_actions)``"""
+        with _torch.inference_mode():
+            obs = _torch.as_tensor(_as_array(observations), device=self.device)
+            return self._module(obs).cpu().numpy()
+
+    def predict(self, observation: _np.ndarray) -> _np.ndarray | int:
+        """Greedy action of an observation, or of each observation of a batch.
+
+        Parameters
+        ----------
+        observation : np.ndarray
+            One observation of shape `observation_shape`, or a batch of shape ``(N, *observation_shape)``
+
+        Returns
+        -------
+        np.ndarray | int
+            The action, or an array of shape ``(N,)`` with the action of each observation
+        """
+        observation = _as_array(observation)
+        single = observation.shape == self.observation_shape
+        with _torch.inference_mode():
+            obs = _torch.as_tensor(observation[None] if single else observation, device=self.device)
+            actions = self._module(obs).argmax(dim=1).cpu().numpy()
+        return int(actions[0]) if single else actions
+
+
+def load_policy(path: str | Path, device: _torch.device | str = "cpu") -> ExportedPolicy:
+    """Load a policy exported with :func:`export_policy`.
+
+    Only torch is needed, not stable-baselines3. The policy is run once before being returned, so the
+    first decision does not pay for the lazy initialization of TorchScript.
+
+    Parameters
+    ----------
+    path : str | Path
+        Directory the policy was exported to
+    device : torch.device | str, optional
+        Device to run the policy on, by default "cpu"
+
+    Returns
+    -------
+    ExportedPolicy
+        The loaded policy
+    """
+    path = Path(path)
+    with open(path / SPEC_FILE, "r") as file:
+        spec = json.load(file)
+    if spec.get("format") != "torchscript" or spec.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported policy artifact in {path}.")
+
+    device = _torch.device(device)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        module = _torch.jit.load(path / MODULE_FILE, map_location=device)
+    policy = ExportedPolicy(module, spec, device)
+    policy.predict(_np.zeros(policy.observation_shape, dtype=_np.float32))
+    return policy
@@ -1,2 +1,2 @@
-from .data import router as data_router
+from .data import router as data_router, close_endpoints
 from .pilot import router as pilot_router
@@ -1 +1 @@
-from .router import router, get_endpoints, get_endpoint, get_symbols, get_kline_df
\ No newline at end of file
+from .router import router, close_endpoints, get_endpoints, get_endpoint, get_symbols, get_kline_df
\ No newline at end of file
@@ -0,0 +1,384 @@
+from collections import OrderedDict
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import tempfile
+import time
+from typing import Any, Hashable, Iterator, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+
+__all__ = ["KlineCache", "FrameCache", "KLINE_SCHEMA", "to_unix_ms", "from_unix_ms", "timeframe_to_ms"]
+
+KLINE_SCHEMA = pa.schema([
+    ("unix", pa.int64()),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.float64()),
+])
+
+ROW_GROUP_SIZE = 16_384
+
+FRAME_CACHE_BYTES = int(os.environ.get("STOCKSENSE_FRAME_CACHE_BYTES", 256 * 2**20))
+"""Memory budget of the decoded K-line frames kept by each endpoint"""
+
+
+def to_unix_ms(date: datetime) -> int:
+    """Convert a datetime to a unix timestamp in milliseconds. Naive datetimes are taken as UTC."""
+    return int(pd.Timestamp(date).timestamp() * 1000)
+
+
+def from_unix_ms(unix: int) -> datetime:
+    """Convert a unix timestamp in milliseconds to a naive UTC datetime."""
+    return pd.Timestamp(unix, unit="ms").to_pydatetime()
+
+
+def timeframe_to_ms(timeframe: str) -> Optional[int]:
+    """Length of a timeframe such as ``1m``, ``1h`` or ``1d`` in milliseconds, or None if it has no fixed length."""
+    try:
+        return int(pd.Timedelta(timeframe).total_seconds() * 1000)
+    except ValueError:
+        return None
+
+
+def _atomic_write(path: Path, write) -> None:
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}-", dir=path.parent)
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class KlineCache:
+    """On-disk cache of the K-line data of one symbol at one timeframe.
+
+    Bars are stored as Parquet files partitioned by time, next to a ``coverage.json`` manifest listing
+    the time ranges already fetched from the endpoint. New data is merged into the partitions it touches,
+    and range queries only read the partitions and row groups overlapping the range.
+
+    Parameters
+    ----------
+    root : str
+        Cache directory of the endpoint
+    symbol : str
+        The symbol
+    timeframe : str
+        Timeframe of the K-line data
+    """
+
+    def __init__(self, root: str, symbol: str, timeframe: str) -> None:
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self._step = timeframe_to_ms(timeframe)
+        # one file per year for minute bars, per decade for coarser ones
+        self._partition_years = 1 if self._step is not None and self._step < 3600_000 else 10
+        self._dir = Path(root, f"{symbol.replace('/', '')}-{timeframe}")
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._coverage_path = self._dir / "coverage.json"
+        self._coverage: list[tuple[int, int]] = self._load_coverage()
+        self.version = 0
+        """Incremented each time the cached data changes"""
+
+    @property
+    def lock_path(self) -> str:
+        """File to lock while updating the cache, see `FileLock`"""
+        return str(self._dir / ".lock")
+
+    def reload(self) -> None:
+        """Reload the coverage manifest, which other processes sharing the cache may have updated"""
+        coverage = self._load_coverage()
+        if coverage != self._coverage:
+            self._coverage = coverage
+            self.version += 1
+
+    def _load_coverage(self) -> list[tuple[int, int]]:
+        if not self._coverage_path.exists():
+            return []
+        with open(self._coverage_path, "r") as file:
+            return [tuple(interval) for interval in json.load(file)]
+
+    def _save_coverage(self) -> None:
+        def write(path):
+            with open(path, "w") as file:
+                json.dump(self._coverage, file)
+        _atomic_write(self._coverage_path, write)
+        self.version += 1
+
+    def _add_coverage(self, since: int, until: int) -> None:
+        intervals = sorted(self._coverage + [(since, until)])
+        merged = [intervals[0]]
+        for start, end in intervals[1:]:
+            if start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        self._coverage = merged
+
+    def _partition(self, unix: int) -> int:
+        year = pd.Timestamp(unix, unit="ms").year
+        return year - year % self._partition_years
+
+    def _partition_path(self, partition: int) -> Path:
+        return self._dir / f"{partition}.parquet"
+
+    def _partitions(self, since: int, until: int) -> range:
+        return range(self._partition(since), self._partition(until - 1) + 1, self._partition_years)
+
+    def _partition_paths(self, since: int, until: int) -> list[Path]:
+        if since >= until:
+            return []
+        paths = map(self._partition_path, self._partitions(since, until))
+        return [path for path in paths if path.exists()]
+
+    @staticmethod
+    def _row_groups(file: pq.ParquetFile, since: int, until: int) -> list[int]:
+        row_groups = []
+        for idx in range(file.metadata.num_row_groups):
+            stats = file.metadata.row_group(idx).column(0).statistics
+            if stats is None or (stats.min < until and stats.max >= since):
+                row_groups.append(idx)
+        return row_groups
+
+    @staticmethod
+    def _filter(table: pa.Table, since: int, until: int) -> pa.Table:
+        unix = table.column("unix")
+        return table.filter(pc.and_(pc.greater_equal(unix, since), pc.less(unix, until)))
+
+    def _read_partition(self, path: Path, since: int, until: int) -> pa.Table:
+        file = pq.ParquetFile(path)
+        return self._filter(file.read_row_groups(self._row_groups(file, since, until)), since, until)
+
+    def _complete_until(self) -> Optional[int]:
+        """Start of the bar currently in progress, bars from there on are not final yet."""
+        if self._step is None:
+            return None
+        now = int(time.time() * 1000)
+        return now - now % self._step
+
+    def missing(self, since: datetime, until: datetime) -> list[tuple[datetime, datetime]]:
+        """Time ranges within ``[since, until)`` that are not cached yet.
+
+        Returns
+        -------
+        list[tuple[datetime, datetime]]
+            Sorted, non-overlapping ``(since, until)`` ranges to fetch
+        """
+        since, until = to_unix_ms(since), to_unix_ms(until)
+        gaps = []
+        cursor = since
+        for start, end in self._coverage:
+            if end <= cursor:
+                continue
+            if start >= until:
+                break
+            if start > cursor:
+                gaps.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < until:
+            gaps.append((cursor, until))
+        return [(from_unix_ms(start), from_unix_ms(end)) for start, end in gaps]
+
+    def write(self, df: pd.DataFrame, since: datetime, until: datetime) -> None:
+        """Merge fetched K-line data into the cache and mark ``[since, until)`` as covered.
+
+        Bars that are still in progress are not stored, and the coverage stops before them.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            K-line data with columns unix, open, high, low, close and volume
+        since : datetime
+            Start of the fetched range
+        until : datetime
+            End of the fetched range
+        """
+        self.write_ranges(df, [(since, until)])
+
+    def write_ranges(self, df: pd.DataFrame, ranges: list[tuple[datetime, datetime]]) -> None:
+        """Same as :meth:`write`, for data fetched over several ``(since, until)`` ranges at once."""
+        complete_until = self._complete_until()
+        self._write_bars(df)
+        for since, until in ranges:
+            since, until = to_unix_ms(since), to_unix_ms(until)
+            if complete_until is not None:
+                until = min(until, complete_until)
+            if since < until:
+                self._add_coverage(since, until)
+        self._save_coverage()
+
+    def import_frame(self, df: pd.DataFrame) -> None:
+        """Merge K-line data of unknown provenance, e.g. a legacy cache file, into the cache.
+
+        The covered ranges are inferred from the index: each run of consecutive bars is marked as covered,
+        so holes inside the data are reported by :meth:`missing` and fetched again.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            K-line data with columns unix, open, high, low, close and volume
+        """
+        if self._step is None:
+            raise ValueError(f"Cannot infer the covered ranges of timeframe {self.timeframe}")
+        df = self._write_bars(df)
+        unix = df["unix"].sort_values().to_numpy()
+        if len(unix) == 0:
+            return
+        breaks = (unix[1:] - unix[:-1] > self._step).nonzero()[0]
+        starts = [unix[0], *unix[breaks + 1]]
+        ends = [*(unix[breaks] + self._step), unix[-1] + self._step]
+        for start, end in zip(starts, ends):
+            self._add_coverage(int(start), int(end))
+        self._save_coverage()
+
+    def _write_bars(self, df: pd.DataFrame) -> pd.DataFrame:
+        complete_until = self._complete_until()
+        df = df[list(KLINE_SCHEMA.names)]
+        if complete_until is not None:
+            df = df[df["unix"] < complete_until]
+        df = df.astype({"unix": "int64", "open": "float64", "high": "float64",
+                        "low": "float64", "close": "float64", "volume": "float64"})
+
+        if len(df) > 0:
+            years = pd.to_datetime(df["unix"], unit="ms").dt.year.to_numpy()
+            for partition, part in df.groupby(years - years % self._partition_years):
+                path = self._partition_path(partition)
+                if path.exists():
+                    part = pd.concat([pq.read_table(path).to_pandas(), part], ignore_index=True)
+                part = (part.drop_duplicates(subset="unix", keep="last")
+                        .sort_values("unix")
+                        .reset_index(drop=True))
+                table = pa.Table.from_pandas(part, schema=KLINE_SCHEMA, preserve_index=False)
+                _atomic_write(path, lambda tmp: pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE))
+        return df
+
+    def read(self, since: datetime, until: datetime) -> pd.DataFrame:
+        """Read the cached K-line data within ``[since, until)``.
+
+        Returns
+        -------
+        pd.DataFrame
+            K-line data indexed by date, with columns unix, open, high, low, close and volume
+        """
+        since, until = to_unix_ms(since), to_unix_ms(until)
+        tables = [self._read_partition(path, since, until) for path in self._partition_paths(since, until)]
+        table = pa.concat_tables(tables) if tables else KLINE_SCHEMA.empty_table()
+        df = table.to_pandas()
+        df.index = pd.DatetimeIndex(pd.to_datetime(df["unix"], unit="ms"), name="date")
+        return df
+
+    def iter_batches(self, since: datetime, until: datetime, batch_size: int = ROW_GROUP_SIZE) -> Iterator[pa.RecordBatch]:
+        """Iterate over the cached K-line data within ``[since, until)`` in chronological record batches.
+
+        Only one row group is decoded at a time, so memory use does not grow with the size of the range.
+
+        Parameters
+        ----------
+        since : datetime
+            Start of the range
+        until : datetime
+            End of the range
+        batch_size : int, optional
+            Maximum number of bars per batch, by default :data:`ROW_GROUP_SIZE`
+
+        Yields
+        ------
+        pa.RecordBatch
+            Non-empty batches with the columns of :data:`KLINE_SCHEMA`
+        """
+        since, until = to_unix_ms(since), to_unix_ms(until)
+        for path in self._partition_paths(since, until):
+            file = pq.ParquetFile(path)
+            for idx in self._row_groups(file, since, until):
+                table = self._filter(file.read_row_group(idx), since, until)
+                for batch in table.to_batches(max_chunksize=batch_size):
+                    if batch.num_rows > 0:
+                        yield batch
+
+
+class FrameCache:
+    """In-memory LRU cache of decoded K-line frames, bounded by their total size.
+
+    Each frame is stored with the `KlineCache.version` it was read at, and is dropped when looked up
+    with another version, so frames never outlive an update of the data on disk.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Memory budget, as measured by ``DataFrame.memory_usage(deep=True)``
+    """
+
+    def __init__(self, max_bytes: int = FRAME_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._frames: OrderedDict[Hashable, tuple[int, pd.DataFrame, int]] = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @property
+    def max_entry_bytes(self) -> int:
+        """Largest frame admitted, so a single frame cannot flush the whole cache"""
+        return self.max_bytes // 8
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, nbytes = self._frames.pop(key)
+        self._bytes -= nbytes
+
+    def get(self, key: Hashable, version: int) -> Optional[pd.DataFrame]:
+        """Get the frame cached under `key` if it was read at `version`, None otherwise"""
+        entry = self._frames.get(key)
+        if entry is not None and entry[0] != version:
+            self._remove(key)
+            self._invalidations += 1
+            entry = None
+        if entry is None:
+            self._misses += 1
+            return None
+        self._frames.move_to_end(key)
+        self._hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, version: int, df: pd.DataFrame) -> None:
+        """Cache a frame read at `version`, evicting the least recently used frames if over budget"""
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if key in self._frames:
+            self._remove(key)
+        if nbytes > self.max_entry_bytes:
+            return
+        self._frames[key] = (version, df, nbytes)
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._frames)))
+            self._evictions += 1
+
+    def stats(self) -> dict[str, Any]:
+        """Usage of the cache
+
+        Returns
+        -------
+        dict[str, Any]
+            - frames : int, number of cached frames
+            - bytes : int, their total size
+            - max_bytes : int, the memory budget
+            - hits, misses, evictions, invalidations : int, counts since startup
+        """
+        return {
+            "frames": len(self._frames),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+        }
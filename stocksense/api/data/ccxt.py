@@ -1,14 +1,23 @@
-from datetime import datetime
+from datetime import datetime, timezone
+import json
+from pathlib import Path
+import time
 import pandas as pd
 import ccxt
+import ccxt.async_support
 from ccxt.base.exchange import Exchange
 from ccxt.base.errors import NetworkError
+import logging
 import os
 from fastapi import HTTPException
 import asyncio
-from typing import Callable
+from typing import Optional
 
-from ...util.ccxtdl import download as dl
+from ...util.ccxtdl import fetch, load_markets, make_scheduler
+from ...util.executor import disk_pool
+from ...util.ratelimit import RequestScheduler
+from ...util.singleflight import SingleFlight
+from .cache import _atomic_write, timeframe_to_ms
 from .endpoint import Endpoint
 
 import warnings
@@ -17,51 +26,147 @@ warnings.filterwarnings(
     "ignore", category=DeprecationWarning, module="ccxt.base.exchange")
 
 
+SYMBOLS_TTL = 24 * 3600
+"""Seconds before the cached list of markets of an exchange is loaded again"""
+
+SYMBOLS_RETRY = 60
+"""Seconds before loading the markets again after a failure, meanwhile the stale list is served"""
+
+logger = logging.getLogger(__name__)
+
+
 class CCXTEndpoint(Endpoint):
+    live = True
+
     def __init__(self, exchange_name: str):
         super().__init__(exchange_name)
         self._exchange: Exchange = getattr(ccxt, exchange_name)()
-        self.symbols = list(self._exchange.load_markets().keys())
+        self._client: tuple[asyncio.AbstractEventLoop, Exchange, RequestScheduler] = None
+
+        # markets are loaded in the background, meanwhile the list cached on disk is served, even if stale
+        self._symbols_path = os.path.join(self._cache_dir, "symbols.json")
+        self._symbols_loaded_at: float = None
+        self._symbols_retry_at = 0.0
+        self._symbol_loads = SingleFlight()
+        self._read_symbols()
+        try:
+            self._symbols_task = asyncio.get_running_loop().create_task(self._prefetch_symbols())
+        except RuntimeError:  # no event loop, markets are loaded on the first call to list_symbols
+            self._symbols_task = None
 
-    async def get_kline(self, symbol: str, since: datetime, until: datetime, timeframe: str) -> pd.DataFrame:
+    def _read_symbols(self) -> None:
+        if os.path.exists(self._symbols_path):
+            with open(self._symbols_path, "r") as file:
+                cached = json.load(file)
+            self.symbols = cached["symbols"]
+            self._symbols_loaded_at = cached["loaded_at"]
+
+    def _write_symbols(self) -> None:
+        def write(path):
+            with open(path, "w") as file:
+                json.dump({"loaded_at": self._symbols_loaded_at, "symbols": self.symbols}, file)
+        _atomic_write(Path(self._symbols_path), write)
+
+    async def _load_symbols(self) -> None:
+        try:
+            exchange, scheduler = self._session()
+            markets = await load_markets(self.name, exchange, scheduler, reload=True)
+            self.symbols = list(markets.keys())
+            self._symbols_loaded_at = time.time()
+            await disk_pool.run(self._write_symbols)
+        except (ccxt.BaseError, OSError):
+            logger.warning("Failed to load the markets of %s, retrying in %ss", self.name, SYMBOLS_RETRY,
+                           exc_info=True)
+            self._symbols_retry_at = time.time() + SYMBOLS_RETRY
+
+    async def _prefetch_symbols(self) -> None:
+        try:
+            await self.list_symbols()
+        except HTTPException:
+            pass  # reported again on the next call
+
+    async def list_symbols(self) -> list[str]:
+        now = time.time()
+        stale = self._symbols_loaded_at is None or now - self._symbols_loaded_at > SYMBOLS_TTL
+        if stale and now >= self._symbols_retry_at:
+            await self._symbol_loads.do("markets", self._load_symbols)
+        if not self.symbols:
+            raise HTTPException(
+                status_code=503, detail="Network error: failed to load markets")
+        return self.symbols
+
+    def _session(self) -> tuple[Exchange, RequestScheduler]:
+        """Async exchange and rate limit scheduler shared by all requests to this exchange on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client[0] is not loop:
+            # the exchange of another loop cannot be closed from this one, it goes away with its loop
+            exchange = getattr(ccxt.async_support, self.name)({'enableRateLimit': False})
+            self._client = (loop, exchange, make_scheduler(self.name, self._exchange))
+        return self._client[1], self._client[2]
+
+    async def _ready_session(self) -> tuple[Exchange, RequestScheduler]:
+        """Same as :meth:`_session`, with the markets of the exchange loaded, once for all requests"""
+        exchange, scheduler = self._session()
+        if not exchange.markets and time.time() >= self._symbols_retry_at:
+            await self._symbol_loads.do("markets", self._load_symbols)
+        return exchange, scheduler
+
+    async def close(self) -> None:
+        if self._symbols_task is not None:
+            self._symbols_task.cancel()
+        if self._client is not None:
+            loop, exchange, _ = self._client
+            self._client = None
+            if loop is asyncio.get_running_loop():
+                await exchange.close()
+
+    async def _download_missing(self, symbol: str, since: datetime, until: datetime, timeframe: str) -> None:
+        await disk_pool.run(self._import_legacy_cache, symbol, timeframe)
+        gaps = self._kline_cache(symbol, timeframe).missing(since, until)
+        if gaps:
+            await self._download_kline_data(symbol, gaps, timeframe)
+
+    def _import_legacy_cache(self, symbol: str, timeframe: str) -> None:
+        """Move a pickle written by older versions, which held a whole download, into the K-line cache"""
         data_path = os.path.join(
-            self._cache_dir, f"binance-{symbol.replace('/', '')}-{timeframe}.pkl")
-        if not os.path.exists(data_path):
-            await self._download_kline_data(symbol, since, until, timeframe)
-        df = pd.read_pickle(data_path)
-        # TODO: check if specified time range is available in the data
-        return df.loc[(since < df.index) & (df.index < until), :]
-        # return df
-
-    async def watch_ticker(
-            self,
-            symbol: str,
-            timeframe: str,
-            callback: Callable[[pd.DataFrame], bool] = lambda: True,
-            /,
-            interval: int = 5,
-            limit: int = 100) -> None:
-        while True:
-            raw = self._exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
-            df = pd.DataFrame(
-                raw, columns=["unix", "open", "high", "low", "close", "volume"])
-            df["date"] = pd.to_datetime(df["unix"], unit="ms")
-            df.set_index("date", inplace=True)
-            # yield df
-            if not callback(df):
-                break
-            await asyncio.sleep(interval)
-
-    async def _download_kline_data(self, symbol: str, since: datetime, until: datetime, timeframe: str):
+            self._cache_dir, f"{self.name}-{symbol.replace('/', '')}-{timeframe}.pkl")
+        if os.path.exists(data_path):
+            self._kline_cache(symbol, timeframe).import_frame(pd.read_pickle(data_path))
+            os.remove(data_path)
+
+    async def poll_kline(self, symbol: str, timeframe: str, since: Optional[int], limit: int) -> pd.DataFrame:
+        step = timeframe_to_ms(timeframe)
+        now = int(time.time() * 1000)
+        if since is None:
+            since = now - now % step - (limit - 1) * step
+        exchange, scheduler = await self._ready_session()
+        try:
+            return await fetch(
+                exchange_name=self.name,
+                symbol=symbol,
+                timeframe=timeframe,
+                windows=[(datetime.fromtimestamp(since / 1000, timezone.utc),
+                          datetime.fromtimestamp((now + step) / 1000, timezone.utc))],
+                exchange=exchange,
+                scheduler=scheduler,
+            )
+        except NetworkError:
+            raise HTTPException(
+                status_code=503, detail="Network error: API request failed")
+
+    async def _download_kline_data(self, symbol: str, gaps: list[tuple[datetime, datetime]], timeframe: str):
+        exchange, scheduler = await self._ready_session()
         try:
-            await dl(
-                exchange_names=["binance"],
-                symbols=[symbol],
+            df = await fetch(
+                exchange_name=self.name,
+                symbol=symbol,
                 timeframe=timeframe,
-                dir=self._cache_dir,
-                since=since,
-                until=until,
+                windows=[(since.replace(tzinfo=timezone.utc), until.replace(tzinfo=timezone.utc))
+                         for since, until in gaps],
+                exchange=exchange,
+                scheduler=scheduler,
             )
         except NetworkError:
             raise HTTPException(
                 status_code=503, detail="Network error: API request failed")
+        await disk_pool.run(self._kline_cache(symbol, timeframe).write_ranges, df, gaps)
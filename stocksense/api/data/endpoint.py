@@ -1,13 +1,50 @@
 from abc import ABC, abstractmethod
+import asyncio
 from datetime import datetime
-from typing import Callable, Optional
+from typing import Any, Callable, Iterator, Optional
 import pandas as pd
+import pyarrow as pa
 import os
 
+from stocksense.util.executor import disk_pool
+from stocksense.util.filelock import FileLock
+from stocksense.util.singleflight import SingleFlight
 from stocksense.util.singleton import SingletonABCMeta
+from .feed import feed_hub
+from .symbols import SymbolIndex
+from .cache import FrameCache, KlineCache, KLINE_SCHEMA, ROW_GROUP_SIZE, timeframe_to_ms, to_unix_ms
+
+
+KLINE_ROW_BYTES = 8 * (1 + len(KLINE_SCHEMA))
+"""Size in memory of a decoded K-line bar: the date index and the K-line columns"""
+
+
+def align_klines(frames: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
+    """Restrict K-line data of several symbols to the dates all of them have
+
+    Parameters
+    ----------
+    frames : dict[str, pd.DataFrame]
+        K-line data of each symbol, indexed by date
+
+    Returns
+    -------
+    dict[str, pd.DataFrame]
+        The K-line data of each symbol, all with the same index
+    """
+    if not frames:
+        return frames
+    dfs = iter(frames.values())
+    index = next(dfs).index
+    for df in dfs:
+        index = index.intersection(df.index)
+    return {symbol: df.loc[index] for symbol, df in frames.items()}
 
 
 class Endpoint(metaclass=SingletonABCMeta):
+    live = False
+    """Whether the endpoint implements :meth:`poll_kline`, and so can feed live data"""
+
     def __init__(self, name: str):
         self.name = name
         self.symbols: list[str] = []
@@ -17,8 +54,63 @@ class Endpoint(metaclass=SingletonABCMeta):
         self._cache_dir = os.path.join("cache", self.name)
         if not os.path.exists(self._cache_dir):
             os.makedirs(self._cache_dir)
+        self._kline_caches: dict[tuple[str, str], KlineCache] = {}
+        self._kline_updates = SingleFlight()
+        self._frames = FrameCache()
+        self._symbol_index: SymbolIndex = None
+
+    def _kline_cache(self, symbol: str, timeframe: str) -> KlineCache:
+        """Get the on-disk K-line cache of a symbol at a timeframe"""
+        key = (symbol, timeframe)
+        if key not in self._kline_caches:
+            self._kline_caches[key] = KlineCache(self._cache_dir, symbol, timeframe)
+        return self._kline_caches[key]
+
+    async def _read_frame(self, cache: KlineCache, since: datetime, until: datetime) -> pd.DataFrame:
+        """Read K-line data from the cache, through the in-memory frame cache. The frame must not be modified."""
+        key = (cache.symbol, cache.timeframe, to_unix_ms(since), to_unix_ms(until))
+        version = cache.version
+        df = self._frames.get(key, version)
+        if df is None:
+            df = await disk_pool.run(cache.read, since, until)
+            self._frames.put(key, version, df)
+        return df
+
+    def frame_cache_stats(self) -> dict[str, Any]:
+        """Usage of the in-memory cache of decoded K-line data, see `FrameCache.stats`"""
+        return self._frames.stats()
+
+    async def _update_kline_cache(self, symbol: str, since: datetime, until: datetime, timeframe: str) -> KlineCache:
+        """Download the parts of ``[since, until)`` missing from the K-line cache of a symbol
+
+        Concurrent calls for the same range share a single download. Calls for overlapping ranges, from
+        this process or from others sharing the cache directory, take turns holding the file lock of the
+        cache and only download what is still missing once they hold it.
+        """
+        cache = self._kline_cache(symbol, timeframe)
+        if cache.missing(since, until):
+            key = (symbol, timeframe, to_unix_ms(since), to_unix_ms(until))
+            await self._kline_updates.do(key, lambda: self._locked_download(cache, symbol, since, until, timeframe))
+        return cache
+
+    async def _locked_download(
+            self, cache: KlineCache, symbol: str, since: datetime, until: datetime, timeframe: str) -> None:
+        async with FileLock(cache.lock_path):
+            await disk_pool.run(cache.reload)
+            if cache.missing(since, until):
+                await self._download_missing(symbol, since, until, timeframe)
+
+    async def _download_missing(self, symbol: str, since: datetime, until: datetime, timeframe: str) -> None:
+        """Download the parts of ``[since, until)`` missing from the K-line cache of a symbol into the cache
+
+        Called with the file lock of the cache held, and its coverage freshly reloaded.
+        """
+        raise NotImplementedError
 
-    def list_symbols(self) -> list[str]:
+    async def close(self) -> None:
+        """Release the connections held by the endpoint, on server shutdown"""
+
+    async def list_symbols(self) -> list[str]:
         """Get a list of symbols available on the endpoint
 
         Returns
@@ -28,6 +120,19 @@ class Endpoint(metaclass=SingletonABCMeta):
         """
         return self.symbols
 
+    async def search_symbols(self, query: str = "", offset: int = 0, limit: int = 100) -> tuple[int, list[str]]:
+        """Search the symbols available on the endpoint, see `SymbolIndex.search`
+
+        Returns
+        -------
+        tuple[int, list[str]]
+            Total number of symbols matching `query`, and the requested page of them
+        """
+        symbols = await self.list_symbols()
+        if self._symbol_index is None or self._symbol_index.source is not symbols:
+            self._symbol_index = await disk_pool.run(SymbolIndex, symbols)
+        return self._symbol_index.search(query, offset, limit)
+
     async def get_kline(self, symbol: str, since: datetime, until: datetime, timeframe: str) -> pd.DataFrame:
         """Get K-line data for a symbol
 
@@ -58,18 +163,66 @@ class Endpoint(metaclass=SingletonABCMeta):
             - close : float, closing price
             - volume : float, volume of the asset traded
         """
-        raise NotImplementedError
+        cache = await self._update_kline_cache(symbol, since, until, timeframe)
+        return (await self._read_frame(cache, since, until)).copy()
+
+    async def get_kline_batches(
+            self,
+            symbol: str,
+            since: datetime,
+            until: datetime,
+            timeframe: str,
+            batch_size: int = ROW_GROUP_SIZE) -> Iterator[pa.RecordBatch]:
+        """Get K-line data for a symbol as record batches, for streaming it without holding it all in memory
+
+        The data is fetched before returning, so errors are raised here rather than while iterating.
+        The batches are then read lazily from the K-line cache.
+
+        Parameters
+        ----------
+        symbol : str
+            The symbol to get data for
+        since : datetime
+            Start of the time range
+        until : datetime
+            End of the time range
+        timeframe : str
+            Timeframe for K-line data, see :meth:`get_kline`
+        batch_size : int, optional
+            Maximum number of bars per batch
 
-    def get_multiple_kline(self, symbol: list[str], begin: datetime, end: datetime, timeframe: str) -> dict[str, pd.DataFrame]:
+        Returns
+        -------
+        Iterator[pa.RecordBatch]
+            Chronological batches with columns unix, open, high, low, close and volume
+        """
+        cache = await self._update_kline_cache(symbol, since, until, timeframe)
+        step = timeframe_to_ms(timeframe)
+        if step is None or (to_unix_ms(until) - to_unix_ms(since)) // step * KLINE_ROW_BYTES > self._frames.max_entry_bytes:
+            return cache.iter_batches(since, until, batch_size)  # too large to keep in memory
+        df = await self._read_frame(cache, since, until)
+        table = pa.Table.from_pandas(df[KLINE_SCHEMA.names], schema=KLINE_SCHEMA, preserve_index=False)
+        return iter(table.to_batches(max_chunksize=batch_size))
+
+    async def get_multiple_kline(
+            self,
+            symbols: list[str],
+            since: datetime,
+            until: datetime,
+            timeframe: str,
+            align: bool = True) -> dict[str, pd.DataFrame]:
         """Get K-line data for multiple symbols
 
+        The symbols are fetched concurrently. Endpoints able to download several symbols in one
+        request override this method to do so.
+
         Parameters
         ----------
-        symbol : list
+        symbols : list[str]
             List of symbols to get data for
-        begin : datetime
+        since : datetime
             Start of the time range
-        end : datetime
+        until : datetime
             End of the time range
         timeframe : str
             Timeframe for K-line data.
@@ -77,11 +230,14 @@ class Endpoint(metaclass=SingletonABCMeta):
                 1m, 2m, ..., 59m - for minutes  
                 1h, 2h, ..., 23h - for hours  
                 1d, ..., 7d - for days.
+        align : bool, optional
+            Whether to keep only the dates all symbols have data for, by default True
 
         Returns
         -------
         dict[str, pd.DataFrame]
-            A dictionary containing K-line data for each symbol. Each value is a DataFrame containing columns:
+            A dictionary containing K-line data for each symbol, in the order of `symbols`.
+            Each value is a DataFrame containing columns:
             - date : datetime, beginning of the timeframe
             - unix : int, unix timestamp of the beginning of the timeframe
             - open : float, opening price
@@ -90,18 +246,42 @@ class Endpoint(metaclass=SingletonABCMeta):
             - close : float, closing price
             - volume : float, volume of the asset traded
         """
-        raise NotImplementedError
+        results = await asyncio.gather(
+            *(self.get_kline(symbol, since, until, timeframe) for symbol in symbols))
+        frames = dict(zip(symbols, results))
+        return align_klines(frames) if align else frames
+
+    async def poll_kline(self, symbol: str, timeframe: str, since: Optional[int], limit: int) -> pd.DataFrame:
+        """Fetch the latest K-line data of a symbol, bypassing the cache, for live feeds
+
+        Parameters
+        ----------
+        symbol : str
+            The symbol to get data for
+        timeframe : str
+            Timeframe for K-line data, see :meth:`get_kline`
+        since : Optional[int]
+            Unix timestamp in milliseconds of the first bar to fetch, or None for the latest `limit` bars
+        limit : int
+            Maximum number of bars to fetch when `since` is None
+
+        Returns
+        -------
+        pd.DataFrame
+            K-line data with columns unix, open, high, low, close and volume, the last bar possibly in progress
+        """
+        raise NotImplementedError(f"Endpoint {self.name} does not support live data")
 
     async def watch_ticker(
             self,
             symbol: str,
             timeframe: str,
             callback: Callable[[pd.DataFrame], bool],
-            /,
-            interval: Optional[int],
-            limit: Optional[int]) -> None:
+            /) -> None:
         """Subscribe to K-line data updates for a symbol
 
+        The updates come from the live feed shared with every other subscriber, see `FeedHub`.
+
         Parameters
         ----------
         symbol : str
@@ -114,11 +294,13 @@ class Endpoint(metaclass=SingletonABCMeta):
                 1d, ..., 7d - for days.
         callback : Callable[[pd.DataFrame], bool]
             A callback function that will be called each time new data is available.
-            A single argument is passed to the callback: a DataFrame containing the new data.
+            A single argument is passed to the callback: a DataFrame containing the new data,
+            that is the latest bars on the first call and the new or updated bars afterwards.
             The function should return True to continue watching, or False to stop.
-        interval : Optional[int]
-            Time interval in seconds between each data fetch
-        limit : Optional[int]
-            Number of data points to fetch each time
         """
-        raise NotImplementedError
+        async with feed_hub.subscribe(self, symbol, timeframe) as updates:
+            async for _, bars in updates:
+                df = pd.DataFrame(bars)
+                df.index = pd.DatetimeIndex(pd.to_datetime(df["unix"], unit="ms"), name="date")
+                if not callback(df):
+                    break
@@ -0,0 +1,197 @@
+import asyncio
+from contextlib import asynccontextmanager
+import logging
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Optional
+
+import pandas as pd
+
+if TYPE_CHECKING:
+    from .endpoint import Endpoint
+
+
+__all__ = ["FeedHub", "Subscription", "feed_hub"]
+
+POLL_INTERVAL = 5.0
+"""Seconds between two polls of a feed"""
+
+HISTORY = 100
+"""Number of latest bars a feed keeps, and sends to new subscribers"""
+
+QUEUE_SIZE = 64
+"""Updates buffered per subscriber, a subscriber falling further behind is dropped"""
+
+Fetch = Callable[["Endpoint", str, str, Optional[int], int], Awaitable[pd.DataFrame]]
+
+logger = logging.getLogger(__name__)
+
+
+def _poll_kline(endpoint: "Endpoint", symbol: str, timeframe: str, since: Optional[int], limit: int) -> Awaitable[pd.DataFrame]:
+    return endpoint.poll_kline(symbol, timeframe, since, limit)
+
+
+class Subscription:
+    """Updates of a feed for one subscriber, iterate over it to receive them.
+
+    Each update is a ``(kind, bars)`` pair. The first one has kind ``"snapshot"`` and holds the latest
+    bars, the following ones have kind ``"delta"`` and hold the bars which are new or changed since.
+    Bars are dicts with keys unix, open, high, low, close and volume. Iteration stops if the subscriber
+    falls more than :data:`QUEUE_SIZE` updates behind, in which case `lagged` is set.
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.lagged = False
+
+    def _put(self, update: tuple[str, list[dict]]) -> bool:
+        try:
+            self._queue.put_nowait(update)
+            return True
+        except asyncio.QueueFull:
+            self.lagged = True
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(None)
+            return False
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> tuple[str, list[dict]]:
+        update = await self._queue.get()
+        if update is None:
+            raise StopAsyncIteration
+        return update
+
+
+class _Feed:
+    """Polls the K-line data of one symbol and fans the changes out to every subscriber"""
+
+    def __init__(self, fetch: Fetch, endpoint: "Endpoint", symbol: str, timeframe: str,
+                 interval: float, history: int) -> None:
+        self._fetch = fetch
+        self._endpoint = endpoint
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.interval = interval
+        self.history = history
+        self.bars: dict[int, dict] = {}
+        self.subscriptions: set[Subscription] = set()
+        self.polls = 0
+        self._task: asyncio.Task = None
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription()
+        if self.bars:
+            subscription._put(("snapshot", list(self.bars.values())))
+        self.subscriptions.add(subscription)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.subscriptions.discard(subscription)
+        if not self.subscriptions and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _merge(self, df: pd.DataFrame) -> list[dict]:
+        """Store fetched bars, and return those which are new or changed"""
+        changed = []
+        for bar in df[["unix", "open", "high", "low", "close", "volume"]].to_dict("records"):
+            bar["unix"] = int(bar["unix"])
+            if self.bars.get(bar["unix"]) != bar:
+                self.bars[bar["unix"]] = bar
+                changed.append(bar)
+        if len(self.bars) > self.history:
+            for unix in sorted(self.bars)[:len(self.bars) - self.history]:
+                del self.bars[unix]
+        return changed
+
+    def _publish(self, update: tuple[str, list[dict]]) -> None:
+        for subscription in list(self.subscriptions):
+            if not subscription._put(update):
+                self.subscriptions.discard(subscription)
+
+    async def _run(self) -> None:
+        while True:
+            # from the latest bar on, which may still have been in progress
+            since = max(self.bars) if self.bars else None
+            try:
+                df = await self._fetch(self._endpoint, self.symbol, self.timeframe, since, self.history)
+            except Exception:
+                logger.exception("Failed to poll %s %s %s", self._endpoint.name, self.symbol, self.timeframe)
+            else:
+                self.polls += 1
+                first = since is None
+                changed = self._merge(df)
+                if first and self.bars:
+                    self._publish(("snapshot", list(self.bars.values())))
+                elif changed:
+                    self._publish(("delta", changed))
+            await asyncio.sleep(self.interval)
+
+
+class FeedHub:
+    """Live K-line feeds shared by all subscribers.
+
+    Subscribers of the same endpoint, symbol and timeframe share one feed, polling the endpoint once
+    per interval however many they are. A feed starts with its first subscriber and stops with its last.
+
+    Parameters
+    ----------
+    fetch : Fetch, optional
+        ``fetch(endpoint, symbol, timeframe, since, limit)`` returning the bars from unix time `since` on,
+        or the latest `limit` bars if `since` is None. By default `Endpoint.poll_kline`.
+    interval : float, optional
+        Seconds between two polls of a feed, by default :data:`POLL_INTERVAL`
+    history : int, optional
+        Number of latest bars kept per feed and sent to new subscribers, by default :data:`HISTORY`
+    """
+
+    def __init__(self, fetch: Fetch = _poll_kline, interval: float = POLL_INTERVAL, history: int = HISTORY) -> None:
+        self._fetch = fetch
+        self.interval = interval
+        self.history = history
+        self._feeds: dict[tuple[str, str, str], _Feed] = {}
+
+    @asynccontextmanager
+    async def subscribe(self, endpoint: "Endpoint", symbol: str, timeframe: str) -> AsyncIterator[Subscription]:
+        """Subscribe to the K-line data of a symbol for the duration of the context
+
+        Parameters
+        ----------
+        endpoint : Endpoint
+            The endpoint to poll
+        symbol : str
+            The symbol to watch
+        timeframe : str
+            Timeframe of the K-line data
+
+        Yields
+        ------
+        Subscription
+            The updates of the feed
+        """
+        key = (endpoint.name, symbol, timeframe)
+        feed = self._feeds.get(key)
+        if feed is None:
+            feed = self._feeds[key] = _Feed(self._fetch, endpoint, symbol, timeframe, self.interval, self.history)
+        subscription = feed.subscribe()
+        try:
+            yield subscription
+        finally:
+            feed.unsubscribe(subscription)
+            if not feed.subscriptions and self._feeds.get(key) is feed:
+                del self._feeds[key]
+
+    def stats(self) -> list[dict]:
+        """Running feeds, with their number of subscribers and of polls so far"""
+        return [
+            {"endpoint": endpoint, "symbol": symbol, "timeframe": timeframe,
+             "subscribers": len(feed.subscriptions), "polls": feed.polls}
+            for (endpoint, symbol, timeframe), feed in self._feeds.items()
+        ]
+
+
+feed_hub = FeedHub()
+"""Feeds shared by the whole server"""
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import PlainTextResponse
+from fastapi import APIRouter, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+import asyncio
 from datetime import datetime
+from importlib import import_module
+from typing import Any, Callable, Optional
 import pandas as pd
-from ccxt.base.errors import NetworkError
 
+from ...util.executor import disk_pool, executor_stats
+from .cache import from_unix_ms
 from .endpoint import Endpoint
-from .ccxt import CCXTEndpoint
-# from .baostock import BaostockEndpoint
-from .yfinance import YFinanceEndpoint
+from .feed import Subscription, feed_hub
+from .stream import KLINE_MEDIA_TYPES, negotiate_media_type, encode_kline
 
 
 router = APIRouter(
@@ -16,17 +19,24 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-endpoints: dict[str, Endpoint] = {
-    # "baostock": BaostockEndpoint(),
-    "yfinance": YFinanceEndpoint(),
+def _lazy_endpoint(module: str, name: str, *args) -> Callable[[], Endpoint]:
+    """Factory of an endpoint importing its module when called, as the SDKs take long to import"""
+    def factory() -> Endpoint:
+        return getattr(import_module(module, __package__), name)(*args)
+    return factory
+
+
+endpoint_factories: dict[str, Callable[[], Endpoint]] = {
+    # "baostock": _lazy_endpoint(".baostock", "BaostockEndpoint"),
+    "yfinance": _lazy_endpoint(".yfinance", "YFinanceEndpoint"),
+    "binance": _lazy_endpoint(".ccxt", "CCXTEndpoint", "binance"),
+    "huobi": _lazy_endpoint(".ccxt", "CCXTEndpoint", "huobi"),
+    "bitfinex2": _lazy_endpoint(".ccxt", "CCXTEndpoint", "bitfinex2"),
 }
+"""How to construct each endpoint, on first use"""
 
-try:
-    endpoints["binance"] = CCXTEndpoint("binance")
-    endpoints["huobi"] = CCXTEndpoint("huobi")
-    endpoints["bitfinex2"] = CCXTEndpoint("bitfinex2")
-except NetworkError:
-    pass
+endpoints: dict[str, Endpoint] = {}
+"""Endpoints constructed so far"""
 
 @router.get("/endpoints")
 async def get_endpoints() -> list[str]:
@@ -37,18 +47,78 @@ async def get_endpoints() -> list[str]:
     dict
         A dictionary containing all available endpoints
     """
-    return list(endpoints.keys())
+    return list(dict.fromkeys([*endpoint_factories, *endpoints]))
+
+
+async def close_endpoints() -> None:
+    """Close the endpoints constructed so far, on server shutdown"""
+    await asyncio.gather(*(endpoint.close() for endpoint in endpoints.values()))
 
 
 def get_endpoint(endpoint: str) -> Endpoint:
     if endpoint not in endpoints:
-        raise HTTPException(status_code=404, detail="Endpoint not found")
+        if endpoint not in endpoint_factories:
+            raise HTTPException(status_code=404, detail="Endpoint not found")
+        endpoints[endpoint] = endpoint_factories[endpoint]()
     return endpoints[endpoint]
 
 
+@router.get("/executors")
+async def get_executor_stats() -> dict[str, dict[str, Any]]:
+    """Get the load of the thread pools running blocking calls of the endpoints
+
+    Returns
+    -------
+    dict[str, dict[str, Any]]
+        For each pool (network, disk, inference): its number of workers, the calls queued and running,
+        the calls completed and the peak queue depth since startup
+    """
+    return executor_stats()
+
+
+@router.get("/cache/stats")
+async def get_cache_stats() -> dict[str, dict[str, Any]]:
+    """Get the usage of the in-memory K-line cache of each endpoint
+
+    Returns
+    -------
+    dict[str, dict[str, Any]]
+        For each endpoint: the number and total size of the cached frames, the memory budget,
+        and the hits, misses, evictions and invalidations since startup
+    """
+    return {name: endpoint.frame_cache_stats() for name, endpoint in endpoints.items()}
+
+
 @router.get("/endpoints/{endpoint}/symbols")
-async def get_symbols(endpoint: str) -> list[str]:
-    return get_endpoint(endpoint).list_symbols()
+async def get_symbols(
+    endpoint: str,
+    response: Response,
+    q: str = "",
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+) -> list[str]:
+    """Search the symbols available on an endpoint
+
+    Parameters
+    ----------
+    endpoint : str
+        Name of the endpoint
+    q : str, optional
+        Case-insensitive text the symbols must contain, by default empty which matches every symbol.
+        Symbols starting with it come first.
+    offset : int, optional
+        Number of matching symbols to skip, by default 0
+    limit : int, optional
+        Maximum number of symbols to return, by default 100
+
+    Returns
+    -------
+    list[str]
+        A page of the matching symbols. The total number of matches is sent in the X-Total-Count header.
+    """
+    total, symbols = await get_endpoint(endpoint).search_symbols(q, offset, limit)
+    response.headers["X-Total-Count"] = str(total)
+    return symbols
 
 
 async def get_kline_df(
@@ -92,15 +162,26 @@ async def get_kline_df(
     return await get_endpoint(endpoint).get_kline(symbol, since, until, timeframe)
 
 
-@router.get("/endpoints/{endpoint}/kline", response_class=PlainTextResponse)
+@router.get(
+    "/endpoints/{endpoint}/kline",
+    response_class=StreamingResponse,
+    responses={200: {"content": {media_type: {} for media_type in KLINE_MEDIA_TYPES}}},
+)
 async def get_kline_csv(
     endpoint: str,
     symbol: str,
     since: int,
     until: int,
     timeframe: str = "1d",
-) -> str:
-    """Get K-line data for a symbol in CSV format
+    accept: Optional[str] = Header(None),
+) -> StreamingResponse:
+    """Stream K-line data for a symbol
+
+    The format is negotiated with the ``Accept`` header:
+    - text/csv (default)
+    - application/x-ndjson, one JSON object per line
+    - application/vnd.apache.arrow.stream, Apache Arrow IPC stream
+    Rows are sent in batches as they are read, so large ranges start arriving immediately.
 
     Parameters
     ----------
@@ -118,11 +199,13 @@ async def get_kline_csv(
             1m, 2m....59m for minutes  
             1h, 2h....23h - for hours  
             1d...7d - for days.
+    accept : str, optional
+        Accept header of the request
 
     Returns
     -------
-    str
-        K-line data for the symbol in CSV string format. Contains columns:
+    StreamingResponse
+        K-line data for the symbol in the negotiated format. Contains columns:
         - date : datetime, beginning of the timeframe
         - unix : int, unix timestamp of the beginning of the timeframe (milliseconds)
         - open : float, opening price
@@ -131,7 +214,85 @@ async def get_kline_csv(
         - close : float, closing price
         - volume : float, volume of the asset traded
     """
-    _since = datetime.fromtimestamp(since / 1000)
-    _until = datetime.fromtimestamp(until / 1000)
-    df = await get_kline_df(endpoint, symbol, _since, _until, timeframe)
-    return df.to_csv()
+    media_type = negotiate_media_type(accept)
+    if media_type is None:
+        raise HTTPException(
+            status_code=406, detail=f"Supported formats: {', '.join(KLINE_MEDIA_TYPES)}")
+    batches = await get_endpoint(endpoint).get_kline_batches(
+        symbol, from_unix_ms(since), from_unix_ms(until), timeframe)
+    return StreamingResponse(
+        disk_pool.iterate(encode_kline(batches, media_type)), media_type=media_type, headers={"Vary": "Accept"})
+
+
+@router.get("/feeds")
+async def get_feeds() -> list[dict[str, Any]]:
+    """Get the live feeds running for `/data/stream` subscribers
+
+    Returns
+    -------
+    list[dict[str, Any]]
+        For each feed: its endpoint, symbol and timeframe, its number of subscribers and of polls so far
+    """
+    return feed_hub.stats()
+
+
+@router.websocket("/stream")
+async def stream_kline(websocket: WebSocket) -> None:
+    """Push live K-line data over a WebSocket
+
+    The client sends JSON messages to manage its subscriptions:
+    - {"action": "subscribe", "endpoint": ..., "symbol": ..., "timeframe": ...}
+    - {"action": "unsubscribe", "endpoint": ..., "symbol": ..., "timeframe": ...}
+
+    For each subscription, the server sends JSON messages with the endpoint, symbol and timeframe and a type:
+    - snapshot: `bars` holds the latest bars
+    - delta: `bars` holds the bars which are new or changed since the previous message
+    - lagged: the client fell too far behind and was unsubscribed, it can subscribe again
+    - error: `detail` tells what went wrong
+    Bars have keys unix, open, high, low, close and volume. All clients watching the same symbol
+    share a single poller upstream.
+    """
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    forwarders: dict[tuple[str, str, str], asyncio.Task] = {}
+
+    async def send(key: tuple[str, str, str], message: dict[str, Any]) -> None:
+        endpoint, symbol, timeframe = key
+        async with send_lock:
+            await websocket.send_json({"endpoint": endpoint, "symbol": symbol, "timeframe": timeframe, **message})
+
+    async def forward(key: tuple[str, str, str], endpoint: Endpoint) -> None:
+        updates: Subscription
+        async with feed_hub.subscribe(endpoint, key[1], key[2]) as updates:
+            async for kind, bars in updates:
+                await send(key, {"type": kind, "bars": bars})
+        if updates.lagged:
+            forwarders.pop(key, None)
+            await send(key, {"type": "lagged"})
+
+    try:
+        while True:
+            message = await websocket.receive_json()
+            key = (message.get("endpoint"), message.get("symbol"), message.get("timeframe", "1m"))
+            action = message.get("action")
+            if action == "subscribe":
+                try:
+                    endpoint = get_endpoint(key[0])
+                except HTTPException as e:
+                    await send(key, {"type": "error", "detail": e.detail})
+                    continue
+                if not endpoint.live:
+                    await send(key, {"type": "error", "detail": "Endpoint does not support live data"})
+                elif key not in forwarders:
+                    forwarders[key] = asyncio.create_task(forward(key, endpoint))
+            elif action == "unsubscribe":
+                if (forwarder := forwarders.pop(key, None)) is not None:
+                    forwarder.cancel()
+            else:
+                await send(key, {"type": "error", "detail": f"Unknown action: {action}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for forwarder in forwarders.values():
+            forwarder.cancel()
+        await asyncio.gather(*forwarders.values(), return_exceptions=True)
@@ -0,0 +1,132 @@
+import io
+import json
+from typing import Callable, Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from .cache import KLINE_SCHEMA
+
+
+__all__ = ["KLINE_MEDIA_TYPES", "negotiate_media_type", "encode_kline"]
+
+STREAM_SCHEMA = pa.schema([("date", pa.timestamp("ms")), *KLINE_SCHEMA])
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _with_date(batch: pa.RecordBatch) -> pa.RecordBatch:
+    date = pc.cast(batch.column("unix"), pa.timestamp("ms"))
+    return pa.RecordBatch.from_arrays([date, *batch.columns], schema=STREAM_SCHEMA)
+
+
+def _format_date(batch: pa.RecordBatch) -> pa.Array:
+    date = pc.cast(pc.cast(batch.column("unix"), pa.timestamp("ms")), pa.timestamp("s"), safe=False)
+    return pc.strftime(date, format=DATE_FORMAT)
+
+
+class _Buffer(io.RawIOBase):
+    """Write-only file whose content is taken out after each write of a streaming encoder"""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _encode_csv(batches: Iterator[pa.RecordBatch]) -> Iterator[bytes]:
+    yield (",".join(STREAM_SCHEMA.names) + "\n").encode()
+    options = pacsv.WriteOptions(include_header=False, quoting_style="none")
+    for batch in batches:
+        batch = pa.RecordBatch.from_arrays(
+            [_format_date(batch), *batch.columns], names=STREAM_SCHEMA.names)
+        sink = pa.BufferOutputStream()
+        pacsv.write_csv(batch, sink, write_options=options)
+        yield sink.getvalue().to_pybytes()
+
+
+def _encode_ndjson(batches: Iterator[pa.RecordBatch]) -> Iterator[bytes]:
+    for batch in batches:
+        dates = _format_date(batch).to_pylist()
+        lines = [
+            json.dumps({"date": date, **row}, separators=(",", ":"))
+            for date, row in zip(dates, batch.to_pylist())
+        ]
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def _encode_arrow(batches: Iterator[pa.RecordBatch]) -> Iterator[bytes]:
+    buffer = _Buffer()
+    with pa.ipc.new_stream(buffer, STREAM_SCHEMA) as writer:
+        yield buffer.drain()  # the schema, so clients can set up before the first batch arrives
+        for batch in batches:
+            writer.write_batch(_with_date(batch))
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+KLINE_MEDIA_TYPES: dict[str, Callable[[Iterator[pa.RecordBatch]], Iterator[bytes]]] = {
+    "text/csv": _encode_csv,
+    "application/x-ndjson": _encode_ndjson,
+    "application/vnd.apache.arrow.stream": _encode_arrow,
+}
+"""Media types the K-line data can be streamed as, the first one is the default"""
+
+
+def negotiate_media_type(accept: Optional[str]) -> Optional[str]:
+    """Pick the K-line media type best matching an ``Accept`` header.
+
+    Parameters
+    ----------
+    accept : Optional[str]
+        Value of the ``Accept`` header, if any
+
+    Returns
+    -------
+    Optional[str]
+        One of :data:`KLINE_MEDIA_TYPES`, or None if the client accepts none of them
+    """
+    default = next(iter(KLINE_MEDIA_TYPES))
+    if not accept:
+        return default
+
+    best, best_q = None, 0.0
+    for item in accept.split(","):
+        media_range, *params = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_range in KLINE_MEDIA_TYPES:
+            media_type = media_range
+        elif media_range in ("*/*", "text/*", "text/plain"):
+            media_type = default
+        else:
+            continue
+        if q > best_q:
+            best, best_q = media_type, q
+    return best
+
+
+def encode_kline(batches: Iterator[pa.RecordBatch], media_type: str) -> Iterator[bytes]:
+    """Encode K-line record batches as chunks of a response body in `media_type`.
+
+    Each batch is encoded and yielded on its own, so the whole body is never held in memory.
+    CSV and NDJSON rows have a ``date`` column formatted as ``YYYY-MM-DD HH:MM:SS`` (UTC),
+    the Arrow IPC stream has it as a millisecond timestamp.
+    """
+    return KLINE_MEDIA_TYPES[media_type](batches)
@@ -0,0 +1,84 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+
+__all__ = ["SymbolIndex"]
+
+NGRAM = 3
+
+
+class SymbolIndex:
+    """Case-insensitive prefix and substring search over the symbols of an endpoint.
+
+    Prefix matches are found by binary search in the sorted symbols. Substring matches use an index of
+    every 1- to 3-gram of the symbols: a query of up to 3 characters is a single lookup, a longer one
+    only checks the symbols containing its rarest 3-gram.
+
+    Parameters
+    ----------
+    symbols : list[str]
+        The symbols to index
+    """
+
+    def __init__(self, symbols: list[str]) -> None:
+        self.source = symbols
+        self.symbols = sorted(set(symbols), key=lambda symbol: (symbol.casefold(), symbol))
+        self._keys = [symbol.casefold() for symbol in self.symbols]
+
+        postings: defaultdict[str, list[int]] = defaultdict(list)
+        for idx, key in enumerate(self._keys):
+            grams = {key[start:start + n] for n in range(1, NGRAM + 1) for start in range(len(key) - n + 1)}
+            for gram in grams:
+                postings[gram].append(idx)  # sorted, as symbols are visited in order
+        self._postings = dict(postings)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def _prefix_range(self, query: str) -> range:
+        start = bisect_left(self._keys, query)
+        end = bisect_left(self._keys, query + "\U0010ffff", lo=start)
+        return range(start, end)
+
+    def _substring_matches(self, query: str) -> list[int]:
+        if len(query) <= NGRAM:
+            return self._postings.get(query, [])
+        candidates = min(
+            (self._postings.get(query[start:start + NGRAM], []) for start in range(len(query) - NGRAM + 1)),
+            key=len)
+        return [idx for idx in candidates if query in self._keys[idx]]
+
+    def search(self, query: str = "", offset: int = 0, limit: int = 100) -> tuple[int, list[str]]:
+        """Find the symbols containing `query`, ignoring case
+
+        Symbols starting with `query` come first, then the other matches, each in alphabetical order.
+
+        Parameters
+        ----------
+        query : str, optional
+            Text to search for, by default empty which matches every symbol
+        offset : int, optional
+            Number of matches to skip, by default 0
+        limit : int, optional
+            Maximum number of matches to return, by default 100
+
+        Returns
+        -------
+        tuple[int, list[str]]
+            Total number of matches, and the requested page of matches
+        """
+        query = query.casefold()
+        if not query:
+            return len(self.symbols), self.symbols[offset:offset + limit]
+
+        prefix = self._prefix_range(query)
+        # matches are sorted and the prefix matches are contiguous among them, so they are cut out in one go
+        matches = self._substring_matches(query)
+        others = matches[:bisect_left(matches, prefix.start)] + matches[bisect_left(matches, prefix.stop):]
+        total = len(prefix) + len(others)
+
+        page = [self.symbols[idx] for idx in prefix[offset:offset + limit]]
+        if len(page) < limit:
+            start = max(0, offset - len(prefix))
+            page += [self.symbols[idx] for idx in others[start:start + limit - len(page)]]
+        return total, page
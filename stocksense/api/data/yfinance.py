@@ -1,60 +1,95 @@
 from datetime import datetime
 from fastapi import HTTPException
+import asyncio
+from contextlib import AsyncExitStack
 import pandas as pd
 import os
-from .endpoint import Endpoint
+import threading
+from ...util.executor import disk_pool, network_pool
+from ...util.filelock import FileLock
+from .endpoint import Endpoint, align_klines
 import yfinance as yf
+from yfinance import shared as yf_shared
 
 import os
 
 
+# yfinance keeps the frames and errors of a download in module globals, so downloads must not overlap
+_download_lock = threading.Lock()
+
+
 class YFinanceEndpoint(Endpoint):
     def __init__(self):
         super().__init__("yfinance")
-        with open("stocksense/api/data/yf_tickers.txt", "r") as f:
+        with open(os.path.join(os.path.dirname(__file__), "yf_tickers.txt"), "r") as f:
             self.symbols = f.read().splitlines()
             self.symbols = [symbol for symbol in self.symbols if "." not in symbol]  # remove indices
-            self.symbols = self.symbols[:100]  # limit to 100 symbols to avoid page freezing
-
-    async def get_kline(self, symbol: str, begin: datetime, end: datetime, timeframe: str) -> pd.DataFrame:
-        data_path = os.path.join(
-            self._cache_dir, f"yfinance-{symbol}-{begin.date()}-{end.date()}-{timeframe}.pkl")
-        if not os.path.exists(data_path):
-            self._download([symbol], begin=begin, end=end, timeframe=timeframe)
-        return pd.read_pickle(data_path)
-
-    async def get_multiple_kline(self, symbols: list[str], begin: datetime, end: datetime, timeframe: str) -> dict[str, pd.DataFrame]:
-        # not tested (!)
-        data_paths = {symbol: os.path.join(
-            self._cache_dir, f"yfinance-{symbol}-{begin.date()}-{end.date()}-{timeframe}.pkl") for symbol in symbols}
-        _symbols = [symbol for (symbol, path) in data_paths.items() if not os.path.exists(path)]
+
+    async def _download_missing(self, symbol: str, begin: datetime, end: datetime, timeframe: str) -> None:
+        for gap_begin, gap_end in self._kline_cache(symbol, timeframe).missing(begin, end):
+            await network_pool.run(self._download, [symbol], begin=gap_begin, end=gap_end, timeframe=timeframe)
+
+    async def get_multiple_kline(
+            self,
+            symbols: list[str],
+            begin: datetime,
+            end: datetime,
+            timeframe: str,
+            align: bool = True) -> dict[str, pd.DataFrame]:
+        _symbols = sorted({symbol for symbol in symbols if self._kline_cache(symbol, timeframe).missing(begin, end)})
         if _symbols:
-            self._download(_symbols, begin=begin, end=end,
-                          timeframe=timeframe, data_path=data_paths[_symbols[0]])
-        return {symbol: pd.read_pickle(path) for (symbol, path) in data_paths.items()}
+            async with AsyncExitStack() as stack:
+                # locked in sorted order, so concurrent calls cannot deadlock
+                for symbol in _symbols:
+                    cache = self._kline_cache(symbol, timeframe)
+                    await stack.enter_async_context(FileLock(cache.lock_path))
+                    await disk_pool.run(cache.reload)
+                # one multi-ticker download spanning the gaps of every symbol
+                gaps = {symbol: self._kline_cache(symbol, timeframe).missing(begin, end) for symbol in _symbols}
+                _symbols = [symbol for symbol in _symbols if gaps[symbol]]
+                if _symbols:
+                    await network_pool.run(
+                        self._download, _symbols,
+                        begin=min(gaps[symbol][0][0] for symbol in _symbols),
+                        end=max(gaps[symbol][-1][1] for symbol in _symbols),
+                        timeframe=timeframe)
+        results = await asyncio.gather(
+            *(self._read_frame(self._kline_cache(symbol, timeframe), begin, end) for symbol in symbols))
+        results = [df.copy() for df in results]
+        frames = dict(zip(symbols, results))
+        return align_klines(frames) if align else frames
 
     def _download(self, symbol: list[str], begin: datetime, end: datetime, timeframe: str) -> None:
         if timeframe.endswith("m") or timeframe.endswith("h"):
             raise HTTPException(
                 status_code=400, detail="Timeframe smaller than 1d is not supported for Yahoo Finance")
         try:
-            result: pd.DataFrame = yf.download(
-                symbol,
-                start=begin.date(),
-                end=end.date(),
-                interval=timeframe,
-                timeout=10)
-            result.drop("Adj Close", axis=1, inplace=True)
+            with _download_lock:
+                result: pd.DataFrame = yf.download(
+                    symbol,
+                    start=begin.date(),
+                    end=pd.Timestamp(end).ceil("D").date(),
+                    interval=timeframe,
+                    timeout=10)
+                # tickers whose download raised, the others were answered, even if with no bars (e.g. a weekend)
+                failed = set(yf_shared._ERRORS)
+            result = result.drop("Adj Close", axis=1, errors="ignore")
             result.rename({"Close": "close", "Open": "open", "High": "high", "Low": "low",
                            "Volume": "volume"}, axis=1, inplace=True)
             result.index.name = "date"
+            tickers = (set(result.columns.get_level_values("Ticker"))
+                       if isinstance(result.columns, pd.MultiIndex) else set())
 
             for ticker in symbol:
-                _res = result.xs(ticker, level="Ticker", axis=1)
-                _res.rename_axis(None, axis=1, inplace=True)
+                if ticker.upper() in failed:
+                    continue  # do not mark the range as covered, it is downloaded again on the next request
+                if ticker in tickers:
+                    _res = result.xs(ticker, level="Ticker", axis=1)
+                    _res = _res.rename_axis(None, axis=1).dropna()
+                else:
+                    _res = pd.DataFrame(columns=["open", "high", "low", "close", "volume"],
+                                        index=pd.DatetimeIndex([], name="date"))
                 _res.insert(0, "unix", _res.index.astype('int64') // 10**6)
-                data_path = os.path.join(
-                    self._cache_dir, f"yfinance-{ticker}-{begin.date()}-{end.date()}-{timeframe}.pkl")
-                _res.to_pickle(data_path)
+                self._kline_cache(ticker, timeframe).write(_res, begin, end)
         except:
             raise Exception("Failed to download data from Yahoo Finance")
@@ -0,0 +1 @@
+from .router import router, get_model, Decision
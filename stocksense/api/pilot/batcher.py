@@ -0,0 +1,168 @@
+import asyncio
+from collections import deque
+import os
+import time
+from typing import Any, Callable
+
+import numpy as np
+
+from ...util.executor import inference_pool
+
+
+__all__ = ["MicroBatcher", "BatcherClosed"]
+
+MAX_BATCH_SIZE = int(os.environ.get("STOCKSENSE_PILOT_MAX_BATCH", 256))
+"""Most decisions run in one forward pass"""
+
+MAX_WAIT = float(os.environ.get("STOCKSENSE_PILOT_MAX_WAIT_MS", 2)) / 1000
+"""Seconds the first decision of a batch waits for others to join it"""
+
+SAMPLES = 10_000
+"""Number of latest latencies and batch sizes the statistics are computed over"""
+
+_CLOSE = object()
+
+
+class BatcherClosed(RuntimeError):
+    """Raised for decisions submitted to a batcher after it was closed"""
+
+
+class MicroBatcher:
+    """Queue concurrent decisions and run them in batches, one forward pass per batch.
+
+    A batch starts with the oldest queued decision and takes the ones queued after it, until it holds
+    `max_batch_size` of them or `max_wait` seconds have passed since it started. Under load, batches
+    are thus full and a forward pass serves many requests; when idle, a decision waits at most
+    `max_wait`. The next batch is gathered while the current one runs on the inference pool.
+
+    Parameters
+    ----------
+    predict : Callable[[np.ndarray], np.ndarray]
+        Maps a batch of observations of shape ``(N, *observation_shape)`` to one action each
+    max_batch_size : int, optional
+        Most decisions per batch, by default :data:`MAX_BATCH_SIZE`
+    max_wait : float, optional
+        Seconds a batch waits to fill up, by default :data:`MAX_WAIT`
+    """
+
+    def __init__(
+        self,
+        predict: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait: float = MAX_WAIT
+    ) -> None:
+        self._predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task = None
+        self._closed = False
+        self._in_flight: asyncio.Future = None
+        self._latencies: deque[float] = deque(maxlen=SAMPLES)
+        self._batch_sizes: deque[int] = deque(maxlen=SAMPLES)
+        self._decisions = 0
+        self._batches = 0
+        self._errors = 0
+
+    async def submit(self, observation: np.ndarray) -> int:
+        """Queue the decision for one observation and await its action"""
+        if self._closed:
+            raise BatcherClosed("The model was unloaded.")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((observation, future, time.perf_counter()))
+        return await future
+
+    def close(self) -> None:
+        """Stop accepting decisions; those already queued are still run"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put_nowait(_CLOSE)
+
+    async def _gather(self, first: tuple) -> tuple[list[tuple], bool]:
+        """Batch `first` with the decisions queued within `max_wait`, and tell whether the batcher closed"""
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if self._queue.empty():
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+            if item is _CLOSE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self) -> None:
+        closed = False
+        while not closed:
+            first = await self._queue.get()
+            if first is _CLOSE:
+                break
+            batch, closed = await self._gather(first)
+            # the previous batch may still be running, until then this one keeps filling up for free
+            if self._in_flight is not None:
+                await self._in_flight
+            self._in_flight = asyncio.ensure_future(self._serve(batch))
+        if self._in_flight is not None:
+            await self._in_flight
+
+    async def _serve(self, batch: list[tuple]) -> None:
+        futures = [future for _, future, _ in batch]
+        try:
+            actions = await inference_pool.run(self._predict, np.stack([obs for obs, _, _ in batch]))
+        except Exception as error:
+            self._errors += 1
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        done = time.perf_counter()
+        for future, action in zip(futures, actions.tolist()):
+            # the client may have disconnected and cancelled its request
+            if not future.done():
+                future.set_result(action)
+        self._latencies.extend(done - queued for _, _, queued in batch)
+        self._batch_sizes.append(len(batch))
+        self._decisions += len(batch)
+        self._batches += 1
+
+    def stats(self) -> dict[str, Any]:
+        """Latency and batching of the decisions so far
+
+        Returns
+        -------
+        dict[str, Any]
+            - decisions : int, decisions served since the model was loaded
+            - batches : int, forward passes run for them
+            - errors : int, forward passes which failed
+            - queued : int, decisions waiting for a batch
+            - max_batch_size : int, most decisions per batch
+            - max_wait_ms : float, longest a batch waits to fill up
+            - mean_batch_size, max_seen_batch_size : batch sizes over the latest :data:`SAMPLES` batches
+            - p50_ms, p99_ms : percentiles of the time from queueing a decision to its action,
+              over the latest :data:`SAMPLES` decisions, None before the first one
+        """
+        latencies = np.array(self._latencies)
+        batch_sizes = np.array(self._batch_sizes)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if len(latencies) else (None, None)
+        return {
+            "decisions": self._decisions,
+            "batches": self._batches,
+            "errors": self._errors,
+            "queued": self._queue.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "mean_batch_size": float(batch_sizes.mean()) if len(batch_sizes) else None,
+            "max_seen_batch_size": int(batch_sizes.max()) if len(batch_sizes) else None,
+            "p50_ms": None if p50 is None else float(p50),
+            "p99_ms": None if p99 is None else float(p99),
+        }
@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import os
+from pathlib import Path
+import re
+import time
+from typing import TYPE_CHECKING, Any
+
+from ...util.executor import disk_pool
+from ...util.singleflight import SingleFlight
+from .batcher import MicroBatcher
+
+if TYPE_CHECKING:
+    from stockcore.policy import ExportedPolicy
+
+
+__all__ = ["ModelRegistry", "PilotModel", "ModelNotFound", "model_registry"]
+
+MODELS_DIR = Path(os.environ.get("STOCKSENSE_PILOT_DIR", "output"))
+"""Where the runs of `benchmark.py` and `grid.py` are, each exporting its policy to ``<run>/policy``"""
+
+MAX_MODELS = int(os.environ.get("STOCKSENSE_PILOT_MODELS", 8))
+"""Most models kept loaded at once"""
+
+POLICY_DIR = "policy"
+
+_NAME = re.compile(r"[\w.-]+")
+
+
+class ModelNotFound(LookupError):
+    """Raised for a model name with no exported policy"""
+
+
+@dataclass
+class PilotModel:
+    """A loaded policy and the batcher running its decisions"""
+    name: str
+    policy: "ExportedPolicy"
+    batcher: MicroBatcher
+    load_seconds: float
+
+    def info(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "algorithm": self.policy.spec["algorithm"],
+            "observation_shape": list(self.policy.observation_shape),
+            "feature_columns": self.policy.spec["feature_columns"],
+            "n_actions": self.policy.n_actions,
+            "load_seconds": self.load_seconds,
+        }
+
+
+def _load_policy(path: Path) -> "ExportedPolicy":
+    # imported on first load, as torch takes seconds to import and only the pilot needs it
+    from stockcore.policy import load_policy
+    return load_policy(path)
+
+
+class ModelRegistry:
+    """In-memory LRU registry of the exported policies under a directory.
+
+    A model is loaded on its first use, on the disk pool, and concurrent first uses share one load.
+    Beyond `max_models`, the least recently used model is unloaded; its queued decisions still run.
+
+    Parameters
+    ----------
+    root : str | Path, optional
+        Directory holding one folder per model, by default :data:`MODELS_DIR`
+    max_models : int, optional
+        Most models kept loaded at once, by default :data:`MAX_MODELS`
+    batcher_options : Any
+        Passed to the :class:`MicroBatcher` of each model
+    """
+
+    def __init__(self, root: str | Path = MODELS_DIR, max_models: int = MAX_MODELS, **batcher_options) -> None:
+        self.root = Path(root)
+        self.max_models = max_models
+        self.batcher_options = batcher_options
+        self._models: OrderedDict[str, PilotModel] = OrderedDict()
+        self._loads = SingleFlight()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def policy_path(self, name: str) -> Path:
+        """Directory of the exported policy of model `name`"""
+        if not _NAME.fullmatch(name) or name.startswith("."):
+            raise ModelNotFound(name)
+        return self.root / name / POLICY_DIR
+
+    def available(self) -> list[str]:
+        """Names of the models with an exported policy"""
+        if not self.root.is_dir():
+            return []
+        return sorted(path.parent.parent.name for path in self.root.glob(f"*/{POLICY_DIR}/spec.json"))
+
+    def loaded(self) -> list[PilotModel]:
+        """Loaded models, from least to most recently used"""
+        return list(self._models.values())
+
+    async def get(self, name: str) -> PilotModel:
+        """The model `name`, loading it if needed
+
+        Raises
+        ------
+        ModelNotFound
+            If no policy was exported for `name`
+        """
+        model = self._models.get(name)
+        if model is not None:
+            self._hits += 1
+            self._models.move_to_end(name)
+            return model
+        self._misses += 1
+        return await self._loads.do(name, lambda: self._load(name))
+
+    async def _load(self, name: str) -> PilotModel:
+        path = self.policy_path(name)
+        if not (path / "spec.json").exists():
+            raise ModelNotFound(name)
+        start = time.perf_counter()
+        policy = await disk_pool.run(_load_policy, path)
+        model = PilotModel(name, policy, MicroBatcher(policy.predict, **self.batcher_options),
+                           time.perf_counter() - start)
+
+        self._models[name] = model
+        while len(self._models) > self.max_models:
+            _, evicted = self._models.popitem(last=False)
+            evicted.batcher.close()
+            self._evictions += 1
+        return model
+
+    def unload(self, name: str) -> bool:
+        """Unload model `name`, and tell whether it was loaded"""
+        model = self._models.pop(name, None)
+        if model is None:
+            return False
+        model.batcher.close()
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        """Usage of the registry, and the latency and batching of each loaded model"""
+        return {
+            "max_models": self.max_models,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "loading": self._loads.in_flight(),
+            "models": {name: model.batcher.stats() for name, model in self._models.items()},
+        }
+
+
+model_registry = ModelRegistry()
+"""Models served by the whole server"""
@@ -0,0 +1,122 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Any
+
+import numpy as np
+
+from .batcher import BatcherClosed
+from .registry import ModelNotFound, PilotModel, model_registry
+
+
+router = APIRouter(
+    prefix="/pilot",
+    tags=["pilot"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+class Decision(BaseModel):
+    """An observation to decide on, of the shape the model was trained with: ``(windows, features)``,
+    or ``(features,)`` without windows"""
+    observation: list[list[float]] | list[float]
+
+
+async def get_model(name: str) -> PilotModel:
+    try:
+        return await model_registry.get(name)
+    except ModelNotFound:
+        raise HTTPException(status_code=404, detail="Model not found")
+
+
+@router.get("/models")
+async def get_models() -> list[dict[str, Any]]:
+    """Get the models with an exported policy, runs of `benchmark.py` or `grid.py`
+
+    Returns
+    -------
+    list[dict[str, Any]]
+        The name of each model, and whether it is loaded
+    """
+    loaded = {model.name for model in model_registry.loaded()}
+    return [{"name": name, "loaded": name in loaded} for name in model_registry.available()]
+
+
+@router.get("/models/{name}")
+async def get_model_info(name: str) -> dict[str, Any]:
+    """Get the description of a model, loading it if needed
+
+    Parameters
+    ----------
+    name : str
+        Name of the model, ``<benchmark>-<model>`` as in the output folder
+
+    Returns
+    -------
+    dict[str, Any]
+        Its algorithm, observation shape and feature columns, number of actions and load time
+    """
+    return (await get_model(name)).info()
+
+
+@router.delete("/models/{name}")
+async def unload_model(name: str) -> dict[str, bool]:
+    """Unload a model, the decisions already queued for it are still served
+
+    Returns
+    -------
+    dict[str, bool]
+        Whether the model was loaded
+    """
+    return {"unloaded": model_registry.unload(name)}
+
+
+@router.post("/models/{name}/decide")
+async def decide(name: str, decision: Decision) -> dict[str, int]:
+    """Decide on an observation with a model
+
+    Concurrent decisions for the same model are batched into a single forward pass, see `/pilot/stats`.
+
+    Parameters
+    ----------
+    name : str
+        Name of the model
+    decision : Decision
+        The observation to decide on
+
+    Returns
+    -------
+    dict[str, int]
+        The action: the index of the stock to hold, or the number of stocks to hold cash
+    """
+    model = await get_model(name)
+    try:
+        observation = np.asarray(decision.observation, dtype=np.float32)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Observation is not a rectangular array")
+    if observation.shape != model.policy.observation_shape:
+        raise HTTPException(status_code=422,
+                            detail=f"Expected an observation of shape {list(model.policy.observation_shape)}, "
+                                   f"got {list(observation.shape)}")
+    try:
+        action = await model.batcher.submit(observation)
+    except BatcherClosed:
+        # unloaded since it was looked up, load it again
+        action = await (await get_model(name)).batcher.submit(observation)
+    return {"action": action}
+
+
+@router.get("/stats")
+async def get_pilot_stats() -> dict[str, Any]:
+    """Get the usage of the model registry and the latency of the decisions
+
+    Returns
+    -------
+    dict[str, Any]
+        The hits, misses and evictions of the registry, and for each loaded model: the decisions and
+        batches run, the mean and largest batch sizes, and the p50 and p99 latencies in milliseconds
+    """
+    return model_registry.stats()
+
+
+# TODO: Implement endpoint for client-side user interaction
+# - Select trading target
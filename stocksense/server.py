@@ -1,13 +1,22 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from stocksense.api import data_router, pilot_router
+from stocksense.api import close_endpoints, data_router, pilot_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await close_endpoints()
 
 
 app = FastAPI(
     title="StockSense API",
     description="API for Stock Trading Automation",
     version="0.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -16,6 +25,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count"],
 )
 
 app.include_router(data_router)
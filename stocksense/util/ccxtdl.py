@@ -3,26 +3,80 @@ import ccxt.async_support as ccxt
 import pandas as pd
 import datetime
 
+from .ratelimit import RequestScheduler, TokenBucket
 
+
+# limit: candles per request
+# weight: cost of one request against the exchange's budget
+# markets_weight: cost of loading the markets, which ccxt does before the first request, by default `weight`
+# capacity, per: budget of `capacity` weight every `per` seconds
 EXCHANGE_LIMIT_RATES = {
     "bitfinex2": {
         "limit": 10_000,
-        "pause_every": 1,
-        "pause": 3,  # seconds
+        "weight": 1,
+        "markets_weight": 3,  # one request per market type
+        "capacity": 30,
+        "per": 60,  # seconds
     },
     "binance": {
         "limit": 1_000,
-        "pause_every": 10,
-        "pause": 1,  # seconds
+        "weight": 2,
+        "markets_weight": 20,  # exchangeInfo
+        "capacity": 6_000,
+        "per": 60,  # seconds
     },
     "huobi": {
         "limit": 1_000,
-        "pause_every": 10,
-        "pause": 1,  # seconds
+        "weight": 1,
+        "markets_weight": 3,  # one request per market type
+        "capacity": 10,
+        "per": 1,  # seconds
     }
 }
 
-# TODO: make this more pythonic
+MAX_IN_FLIGHT = 8
+
+
+def _limit_rate(exchange_name: str, exchange) -> dict:
+    if exchange_name in EXCHANGE_LIMIT_RATES:
+        return EXCHANGE_LIMIT_RATES[exchange_name]
+    # fall back to one request every `rateLimit` milliseconds, as advertised by ccxt
+    return {"limit": 1_000, "weight": 1, "capacity": 1, "per": exchange.rateLimit / 1E3}
+
+
+def make_scheduler(exchange_name: str, exchange) -> RequestScheduler:
+    """Build a request scheduler following the rate limits of an exchange"""
+    rate = _limit_rate(exchange_name, exchange)
+    return RequestScheduler(
+        TokenBucket(rate=rate["capacity"] / rate["per"], capacity=rate["capacity"]),
+        max_in_flight=MAX_IN_FLIGHT)
+
+
+async def load_markets(exchange_name: str, exchange, scheduler: RequestScheduler, reload: bool = False) -> dict:
+    """Load the markets of an exchange through its scheduler, unless already loaded
+
+    ccxt loads them implicitly before the first request otherwise, out of sight of the rate limit.
+
+    Parameters
+    ----------
+    exchange_name : str
+        Name of the exchange
+    exchange : ccxt.async_support.Exchange
+        The exchange instance, which keeps the markets for its later requests
+    scheduler : RequestScheduler
+        Scheduler the load is counted against, with the `markets_weight` of the exchange
+    reload : bool, optional
+        Whether to load the markets even if already loaded, by default False
+
+    Returns
+    -------
+    dict
+        The markets, keyed by symbol
+    """
+    if getattr(exchange, "markets", None) and not reload:
+        return exchange.markets
+    rate = _limit_rate(exchange_name, exchange)
+    return await scheduler.run(exchange.load_markets, reload, cost=rate.get("markets_weight", rate["weight"]))
 
 
 async def _ohlcv(exchange, symbol, timeframe, limit, step_since, timedelta):
@@ -39,45 +93,102 @@ async def _ohlcv(exchange, symbol, timeframe, limit, step_since, timedelta):
     return result_df
 
 
-async def _download_symbol(exchange, symbol, timeframe='5m', since=int(datetime.datetime(year=2020, month=1, day=1).timestamp()*1E3), until=int(datetime.datetime.now().timestamp()*1E3), limit=1000, pause_every=10, pause=1):
+async def _download_symbol(exchange, symbol, timeframe, since, until, scheduler: RequestScheduler, limit=1000, weight=1):
     timedelta = int(pd.Timedelta(timeframe).to_timedelta64()/1E6)
-    tasks = []
-    results = []
-    for step_since in range(since, until, limit * timedelta):
-        tasks.append(
-            asyncio.create_task(
-                _ohlcv(exchange, symbol, timeframe, limit, step_since, timedelta))
-        )
-        if len(tasks) >= pause_every:
-            results.extend(await asyncio.gather(*tasks))
-            await asyncio.sleep(pause)
-            tasks = []
-    if len(tasks) > 0:
-        results.extend(await asyncio.gather(*tasks))
+    results = await asyncio.gather(*(
+        scheduler.run(_ohlcv, exchange, symbol, timeframe, limit, step_since, timedelta, cost=weight)
+        for step_since in range(since, until, limit * timedelta)
+    ))
     final_df = pd.concat(results, ignore_index=True)
-    final_df = final_df.loc[(since < final_df["timestamp_open"]) & (
+    final_df = final_df.loc[(since <= final_df["timestamp_open"]) & (
         final_df["timestamp_open"] < until), :]
-    # del final_df["timestamp_open"]
 
     final_df.rename(columns={"date_open": "date", "timestamp_open": "unix"}, inplace=True)
     final_df.set_index('date', drop=True, inplace=True)
     final_df.sort_index(inplace=True)
     final_df.dropna(inplace=True)
-    final_df.drop_duplicates(inplace=True)
+    final_df.drop_duplicates(subset="unix", inplace=True)
     final_df.drop(columns=["date_close"], inplace=True)
     return final_df
 
 
-async def _download_symbols(exchange_name, symbols, dir, timeframe,  **kwargs):
-    exchange = getattr(ccxt, exchange_name)({'enableRateLimit': True})
-    for symbol in symbols:
-        df = await _download_symbol(exchange=exchange, symbol=symbol, timeframe=timeframe, **kwargs)
+async def _download_symbols(exchange_name, symbols, dir, timeframe, since, until):
+    exchange = getattr(ccxt, exchange_name)({'enableRateLimit': False})
+    rate = _limit_rate(exchange_name, exchange)
+    scheduler = make_scheduler(exchange_name, exchange)
+
+    async def download_one(symbol):
+        df = await _download_symbol(
+            exchange=exchange, symbol=symbol, timeframe=timeframe, since=since, until=until,
+            scheduler=scheduler, limit=rate["limit"], weight=rate["weight"])
         save_file = (
             f"{dir}/{exchange_name}-{symbol.replace('/', '')}-{timeframe}.pkl")
         print(
             f"{symbol} downloaded from {exchange_name} and stored at {save_file}")
         df.to_pickle(save_file)
-    await exchange.close()
+
+    try:
+        await load_markets(exchange_name, exchange, scheduler)
+        await asyncio.gather(*(download_one(symbol) for symbol in symbols))
+    finally:
+        await exchange.close()
+
+
+async def fetch(
+        exchange_name: str,
+        symbol: str,
+        timeframe: str,
+        windows: list[tuple[datetime.datetime, datetime.datetime]],
+        exchange=None,
+        scheduler: RequestScheduler = None) -> pd.DataFrame:
+    """Fetch OHLCV data of a symbol over several time windows, without storing it
+
+    Parameters
+    ----------
+    exchange_name : str
+        Name of the exchange. See https://github.com/ccxt/ccxt for a list of supported exchanges
+    symbol : str
+        Symbol to fetch data for. Available symbols depend on the exchange
+    timeframe : str
+        Timeframe for the OHLCV data, e.g. 1m, 1h or 1d
+    windows : list[tuple[datetime.datetime, datetime.datetime]]
+        ``(since, until)`` time windows to fetch, all pages are fetched concurrently within the rate limit
+    exchange : ccxt.async_support.Exchange, optional
+        Exchange instance to use instead of creating one, e.g. a fake exchange for testing.
+        It is not closed afterwards.
+    scheduler : RequestScheduler, optional
+        Scheduler to share with other downloads from the same exchange, by default one following
+        :data:`EXCHANGE_LIMIT_RATES`
+
+    Returns
+    -------
+    pd.DataFrame
+        OHLCV data within the windows indexed by date, sorted and deduplicated on unix
+    """
+    owns_exchange = exchange is None
+    if owns_exchange:
+        exchange = getattr(ccxt, exchange_name)({'enableRateLimit': False})
+    rate = _limit_rate(exchange_name, exchange)
+    if scheduler is None:
+        scheduler = make_scheduler(exchange_name, exchange)
+    try:
+        if any(since < until for since, until in windows):
+            await load_markets(exchange_name, exchange, scheduler)
+        results = await asyncio.gather(*(
+            _download_symbol(
+                exchange=exchange, symbol=symbol, timeframe=timeframe,
+                since=int(since.timestamp()*1E3), until=int(until.timestamp()*1E3),
+                scheduler=scheduler, limit=rate["limit"], weight=rate["weight"])
+            for since, until in windows if since < until
+        ))
+    finally:
+        if owns_exchange:
+            await exchange.close()
+    if not results:
+        return pd.DataFrame(columns=["unix", "open", "high", "low", "close", "volume"])
+    final_df = pd.concat(results)
+    final_df = final_df[~final_df["unix"].duplicated()]
+    return final_df.sort_index()
 
 
 async def download(
@@ -110,14 +221,9 @@ async def download(
     """
     tasks = []
     for exchange_name in exchange_names:
-
-        limit = EXCHANGE_LIMIT_RATES[exchange_name]["limit"]
-        pause_every = EXCHANGE_LIMIT_RATES[exchange_name]["pause_every"]
-        pause = EXCHANGE_LIMIT_RATES[exchange_name]["pause"]
         tasks.append(
             _download_symbols(
                 exchange_name=exchange_name, symbols=symbols, timeframe=timeframe, dir=dir,
-                limit=limit, pause_every=pause_every, pause=pause,
                 since=int(since.timestamp()*1E3), until=int(until.timestamp()*1E3)
             )
         )
@@ -0,0 +1,111 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextvars
+import functools
+import os
+import threading
+from typing import Any, AsyncIterator, Callable, Iterator, TypeVar
+
+
+__all__ = ["BlockingPool", "network_pool", "disk_pool", "inference_pool", "executor_stats"]
+
+T = TypeVar("T")
+
+NETWORK_WORKERS = int(os.environ.get("STOCKSENSE_NETWORK_WORKERS", 16))
+DISK_WORKERS = int(os.environ.get("STOCKSENSE_DISK_WORKERS", min(8, (os.cpu_count() or 1) + 2)))
+INFERENCE_WORKERS = int(os.environ.get("STOCKSENSE_INFERENCE_WORKERS", 1))
+
+_DONE = object()
+
+
+class BlockingPool:
+    """Bounded thread pool running blocking calls on behalf of the event loop.
+
+    Keeps count of the calls waiting for a worker and of those running, so a saturated pool shows up
+    in :func:`executor_stats` before it shows up in request latencies.
+
+    Parameters
+    ----------
+    name : str
+        Name of the pool, used in thread names and metrics
+    max_workers : int
+        Number of worker threads
+    """
+
+    def __init__(self, name: str, max_workers: int) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix=f"stocksense-{name}")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._peak_queued = 0
+
+    def _call(self, func: Callable[[], T]) -> T:
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run ``func(*args, **kwargs)`` on a worker thread and await its result"""
+        with self._lock:
+            self._queued += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        future = self._executor.submit(self._call, call)
+        # a call cancelled while waiting for a worker never runs, so it leaves the queue here
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future: Future) -> None:
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def iterate(self, iterator: Iterator[T]) -> AsyncIterator[T]:
+        """Advance a blocking iterator on worker threads, one item at a time"""
+        while (item := await self.run(next, iterator, _DONE)) is not _DONE:
+            yield item
+
+    def stats(self) -> dict[str, Any]:
+        """Current load of the pool
+
+        Returns
+        -------
+        dict[str, Any]
+            - max_workers : int, number of worker threads
+            - queued : int, calls waiting for a worker
+            - running : int, calls being run
+            - completed : int, calls finished since startup
+            - peak_queued : int, largest number of calls waiting at once since startup
+        """
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "peak_queued": self._peak_queued,
+            }
+
+
+network_pool = BlockingPool("network", NETWORK_WORKERS)
+"""Pool for blocking network SDK calls (yfinance, sync ccxt)"""
+
+disk_pool = BlockingPool("disk", DISK_WORKERS)
+"""Pool for cache reads, writes and parsing"""
+
+inference_pool = BlockingPool("inference", INFERENCE_WORKERS)
+"""Pool for forward passes of the pilot models, which already use every core through torch"""
+
+
+def executor_stats() -> dict[str, dict[str, Any]]:
+    """Load of every pool, keyed by pool name"""
+    return {pool.name: pool.stats() for pool in (network_pool, disk_pool, inference_pool)}
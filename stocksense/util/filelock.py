@@ -0,0 +1,72 @@
+import asyncio
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+__all__ = ["FileLock"]
+
+
+class FileLock:
+    """Exclusive advisory lock on a file, shared between processes.
+
+    The lock is waited for by polling, so waiting does not hold a thread.
+    Locks are held per open file, so two `FileLock` on the same path exclude each other
+    even within a process.
+
+    Parameters
+    ----------
+    path : str
+        Path of the lock file, created if needed
+    poll_interval : float, optional
+        Seconds between attempts to take the lock, by default 0.05
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.05) -> None:
+        self.path = path
+        self.poll_interval = poll_interval
+        self._fd: int = None
+
+    def _try_lock(self, fd: int) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    async def acquire(self) -> None:
+        """Wait until the lock is free and take it"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while not self._try_lock(fd):
+                await asyncio.sleep(self.poll_interval)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self) -> None:
+        """Release the lock"""
+        fd, self._fd = self._fd, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    async def __aenter__(self) -> "FileLock":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
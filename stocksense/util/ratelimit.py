@@ -0,0 +1,79 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable
+
+from ccxt.base.errors import NetworkError
+
+
+__all__ = ["TokenBucket", "RequestScheduler"]
+
+
+class TokenBucket:
+    """Asynchronous token bucket.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. Waiters are served in arrival order.
+
+    Parameters
+    ----------
+    rate : float
+        Tokens added per second
+    capacity : float
+        Maximum number of tokens, i.e. the largest burst allowed
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, cost: float = 1) -> None:
+        """Wait until `cost` tokens are available and take them"""
+        cost = min(cost, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self._tokens < cost:
+                await asyncio.sleep((cost - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= cost
+
+
+class RequestScheduler:
+    """Run API requests under a shared rate limit, with bounded concurrency and retries.
+
+    Parameters
+    ----------
+    bucket : TokenBucket
+        Rate limit shared by all requests, each request takes `cost` tokens
+    max_in_flight : int
+        Maximum number of requests awaiting a response at the same time
+    max_retries : int
+        Number of times a request failing with a `NetworkError` is retried
+    backoff : float
+        Base delay in seconds before a retry, doubled at each attempt and jittered by +/- 50%
+    """
+
+    def __init__(self, bucket: TokenBucket, max_in_flight: int = 8, max_retries: int = 5, backoff: float = 0.5) -> None:
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def run(self, request: Callable[..., Awaitable[Any]], *args, cost: float = 1, **kwargs) -> Any:
+        """Await ``request(*args, **kwargs)`` once the rate limit allows it, retrying on `NetworkError`"""
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                await self.bucket.acquire(cost)
+                try:
+                    return await request(*args, **kwargs)
+                except NetworkError:
+                    if attempt == self.max_retries:
+                        raise
+            await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+
+__all__ = ["SingleFlight"]
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesce concurrent calls sharing a key into a single call.
+
+    While a call for a key is in flight, later callers with the same key await its result instead of
+    starting their own. The key is forgotten once the call finishes, so the next caller starts afresh.
+    A caller being cancelled does not cancel the call for the others.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    def in_flight(self) -> int:
+        """Number of calls currently running"""
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """Await ``func()``, or the call already running for `key`
+
+        Parameters
+        ----------
+        key : Hashable
+            Identifies calls which can share their result
+        func : Callable[[], Awaitable[T]]
+            Started only if no call for `key` is running
+
+        Returns
+        -------
+        T
+            The result of the call
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
@@ -2,10 +2,13 @@ from abc import ABCMeta
 
 
 class SingletonABCMeta(ABCMeta):
+    """One instance per class and constructor arguments, so ``CCXTEndpoint("binance")`` and
+    ``CCXTEndpoint("huobi")`` are distinct while repeated constructions share an instance"""
     _instances = {}
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(
+        key = (cls, args, tuple(sorted(kwargs.items())))
+        if key not in cls._instances:
+            cls._instances[key] = super(
                 SingletonABCMeta, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
+        return cls._instances[key]